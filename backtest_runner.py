@@ -0,0 +1,141 @@
+import os
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+
+from pivot_store import PIVOT_TYPES
+from timeutil import vn_zoneinfo
+
+REPORT_FILE = "backtest_report.csv"
+
+
+def run_job(job, user_login="lenhat20791", offline=False, cache_dir=None, current_time=None):
+    """
+    Chạy một job (symbol, interval, (start_time, end_time)) với PivotData riêng
+
+    Chạy trong process con nên import s1/test_s1 ngay tại đây, mỗi process có bản s1 riêng.
+    """
+    from s1 import PivotData, set_current_time_and_user
+    from test_s1 import S1HistoricalTester
+    from kline_cache import DEFAULT_CACHE_DIR
+
+    symbol, interval, (start_time, end_time) = job[:3]
+    initial_pivots = job[3] if len(job) > 3 else []
+    name = f"{symbol}_{interval}_{start_time:%Y%m%d%H%M}_{end_time:%Y%m%d%H%M}"
+
+    if current_time is not None:
+        set_current_time_and_user(current_time, user_login)
+
+    tester = S1HistoricalTester(
+        user_login,
+        offline=offline,
+        cache_dir=cache_dir or DEFAULT_CACHE_DIR,
+        symbol=symbol,
+        interval=interval,
+        pivots=PivotData(),
+        log_file=f"debug_{name}.log"
+    )
+    final_pivots = tester.run_test(
+        start_time, end_time,
+        initial_pivots=initial_pivots,
+        results_file=f"test_results_{name}.xlsx"
+    )
+    tester.log_sink.flush()
+
+    stats = tester.last_stats or {'symbol': symbol, 'interval': interval}
+    stats['start_time'] = start_time
+    stats['end_time'] = end_time
+    stats['ok'] = final_pivots is not None
+    return stats
+
+
+def build_report(all_stats):
+    """Gộp thống kê của các job thành một DataFrame, thêm dòng tổng"""
+    import pandas as pd
+
+    report = pd.DataFrame(all_stats)
+    for col in ['candles', 'pivots', 'avg_gap_minutes', *PIVOT_TYPES]:
+        if col not in report.columns:
+            report[col] = None
+    report = report.sort_values(['symbol', 'interval', 'start_time']).reset_index(drop=True)
+
+    totals = {col: report[col].sum() for col in ['candles', 'pivots', *PIVOT_TYPES]}
+    totals['symbol'] = 'TOTAL'
+    # Khoảng cách trung bình có trọng số theo số khoảng giữa các pivot của từng job
+    gaps = report.dropna(subset=['avg_gap_minutes'])
+    weights = (gaps['pivots'] - 1).clip(lower=0)
+    totals['avg_gap_minutes'] = (gaps['avg_gap_minutes'] * weights).sum() / weights.sum() if weights.sum() else None
+    return pd.concat([report, pd.DataFrame([totals])], ignore_index=True)
+
+
+def run_backtests(jobs, user_login="lenhat20791", offline=False, cache_dir=None,
+                  current_time=None, max_workers=None, report_file=REPORT_FILE):
+    """
+    Chạy danh sách job song song trên process pool và trả về báo cáo tổng hợp
+
+    Parameters:
+    jobs (list): Các tuple (symbol, interval, (start_time, end_time)[, initial_pivots]), thời gian UTC
+    max_workers (int): Số process, mặc định bằng số core
+    """
+    max_workers = max_workers or os.cpu_count()
+    all_stats = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(run_job, job, user_login, offline, cache_dir, current_time): job
+            for job in jobs
+        }
+        for future in as_completed(futures):
+            symbol, interval, (start_time, end_time) = futures[future][:3]
+            try:
+                stats = future.result()
+                print(f"✅ {symbol} {interval}: {stats.get('pivots', 0)} pivot")
+            except Exception as e:
+                print(f"❌ Lỗi job {symbol} {interval}: {str(e)}")
+                print(traceback.format_exc())
+                stats = {'symbol': symbol, 'interval': interval, 'ok': False}
+            stats.setdefault('start_time', start_time)
+            stats.setdefault('end_time', end_time)
+            all_stats.append(stats)
+
+    report = build_report(all_stats)
+    if report_file:
+        report.to_csv(report_file, index=False)
+        print(f"Đã lưu báo cáo tổng hợp vào {report_file}")
+    return report
+
+
+def main():
+    """
+    Ví dụ: python backtest_runner.py BTCUSDT,ETHUSDT 30m,1h "2025-03-14 17:00:00" "2025-03-16 12:00:00"
+
+    Thời gian hiện tại của S1 lấy từ CURRENT_UTC_TIME giống test_s1.main
+    """
+    if len(sys.argv) < 5:
+        print(main.__doc__)
+        return None
+
+    symbols = sys.argv[1].split(',')
+    intervals = sys.argv[2].split(',')
+    start_time = datetime.strptime(sys.argv[3], '%Y-%m-%d %H:%M:%S')
+    end_time = datetime.strptime(sys.argv[4], '%Y-%m-%d %H:%M:%S')
+
+    # Chuyển CURRENT_UTC_TIME sang giờ Việt Nam cho set_current_time_and_user trong mỗi worker
+    utc_time = os.environ.get('CURRENT_UTC_TIME') or "2025-03-21 02:40:48"
+    utc_dt = datetime.strptime(utc_time, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+    current_time = utc_dt.astimezone(vn_zoneinfo()).strftime('%Y-%m-%d %H:%M:%S')
+
+    jobs = [(symbol, interval, (start_time, end_time)) for symbol in symbols for interval in intervals]
+    report = run_backtests(
+        jobs,
+        user_login=os.environ.get('CURRENT_USER', 'lenhat20791'),
+        offline=os.environ.get('S1_OFFLINE', '0') == '1',
+        cache_dir=os.environ.get('KLINE_CACHE_DIR'),
+        current_time=current_time
+    )
+    print(report.to_string(index=False))
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+
+from exporters import parse_formats
+from kline_cache import KLINE_COLUMNS
+from timeutil import MINUTE_MS
+
+BASELINE_FILE = "bench_baseline.json"
+DEFAULT_SIZES = (10_000, 100_000, 1_000_000)
+SERIES = ('random_walk', 'trending', 'choppy')
+# Các entry point cần khởi động nhanh khi chạy offline/từ cache
+STARTUP_MODULES = ('test_s1', 's1_stream', 'backtest_runner', 'param_sweep')
+
+# 00:00 15/03/2025 giờ VN
+START_MS = 1741971600000
+
+
+def generate_klines(kind, n, seed=42, start_ms=START_MS, interval_ms=30 * MINUTE_MS, start_price=80000.0):
+    """
+    Sinh n kline OHLC giả lập có thể lặp lại (cùng seed cho cùng kết quả)
+
+    kind: 'random_walk' (đi ngẫu nhiên), 'trending' (có xu hướng tăng), 'choppy' (dao động quanh một mức giá)
+    """
+    rng = np.random.default_rng(seed)
+    if kind == 'random_walk':
+        close = start_price * np.exp(np.cumsum(rng.normal(0, 0.002, n)))
+    elif kind == 'trending':
+        close = start_price * np.exp(np.cumsum(rng.normal(0.0003, 0.002, n)))
+    elif kind == 'choppy':
+        cycle = np.sin(np.arange(n) * 2 * np.pi / 48)
+        close = start_price * (1 + 0.01 * cycle + rng.normal(0, 0.001, n))
+    else:
+        raise ValueError(f"Không có loại chuỗi {kind}, chọn một trong {SERIES}")
+
+    open_ = np.concatenate(([start_price], close[:-1]))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.001, n)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.001, n)))
+    timestamps = start_ms + np.arange(n, dtype=np.int64) * interval_ms
+
+    klines = np.zeros((n, len(KLINE_COLUMNS)), dtype=np.float64)
+    klines[:, 0] = timestamps
+    klines[:, 1] = open_
+    klines[:, 2] = high
+    klines[:, 3] = low
+    klines[:, 4] = close
+    klines[:, 5] = rng.uniform(10, 1000, n)
+    klines[:, 6] = timestamps + interval_ms - 1
+    return klines
+
+
+class StageTimer:
+    """Đo thời gian và (tùy chọn) bộ nhớ đỉnh của một stage bằng tracemalloc"""
+
+    def __init__(self, measure_memory):
+        self.measure_memory = measure_memory
+        self.elapsed = 0.0
+        self.peak_mb = None
+
+    def __enter__(self):
+        if self.measure_memory:
+            tracemalloc.start()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self._start
+        if self.measure_memory:
+            self.peak_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+            tracemalloc.stop()
+        return False
+
+
+def run_case(kind, n, formats, measure_memory, workdir):
+    """
+    Chạy một chuỗi giả lập qua từng stage, trả về list kết quả theo stage
+
+    Thời gian luôn đo ở lượt không bật tracemalloc. Bộ nhớ đỉnh (measure_memory) được đo ở một
+    lượt riêng vì tracemalloc làm chậm 2-3 lần, nên throughput và baseline không bị ảnh hưởng.
+    """
+    from s1 import PivotData
+    from test_s1 import S1HistoricalTester
+
+    klines = generate_klines(kind, n)
+    tester = S1HistoricalTester(
+        offline=True,
+        cache_dir=workdir,
+        pivots=PivotData(),
+        log_file=os.path.join(workdir, "bench.log")
+    )
+
+    def run_stages(trace):
+        timers = {}
+        with StageTimer(trace) as timers['preprocess']:
+            df = tester.prepare_candles(klines)
+
+        tester.pivot_data.clear_all()
+        tester.pivot_store.clear()
+        with StageTimer(trace) as timers['process_new_data']:
+            tester.feed_candles(df)
+
+        with StageTimer(trace) as timers['export']:
+            tester.save_test_results(df, None, os.path.join(workdir, f"bench_{kind}_{n}.xlsx"), formats)
+        return timers
+
+    timed = run_stages(False)
+    traced = run_stages(True) if measure_memory else {}
+    results = []
+    for stage, timer in timed.items():
+        results.append({
+            'series': kind,
+            'candles': n,
+            'stage': stage,
+            'seconds': timer.elapsed,
+            'candles_per_sec': n / timer.elapsed if timer.elapsed else None,
+            'peak_mb': traced[stage].peak_mb if stage in traced else None,
+        })
+
+    tester.log_sink.flush()
+    return results
+
+
+def measure_startup(module, runs=5):
+    """Thời gian (giây, trung vị) để một process Python mới import xong module, tính cả khởi động interpreter"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, '-c', f"import {module}"], cwd=here, check=True)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def baseline_key(row):
+    return f"{row['series']}/{row['candles']}/{row['stage']}"
+
+
+def baseline_value(row):
+    # Startup so sánh theo giây (càng thấp càng tốt), các stage khác theo nến/giây
+    return row['seconds'] if row['stage'] == 'startup' else row['candles_per_sec']
+
+
+def compare_with_baseline(results, baseline, tolerance):
+    """Trả về các stage có candles/sec giảm (hoặc startup tăng) quá tolerance so với baseline"""
+    regressions = []
+    for row in results:
+        key = baseline_key(row)
+        expected = baseline.get(key)
+        actual = baseline_value(row)
+        if not expected or not actual:
+            continue
+        if row['stage'] == 'startup':
+            slower = actual > expected * (1 + tolerance)
+        else:
+            slower = actual < expected * (1 - tolerance)
+        if slower:
+            regressions.append((key, expected, actual))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark các hot path của S1 trên dữ liệu giả lập")
+    parser.add_argument('--sizes', default=','.join(str(size) for size in DEFAULT_SIZES))
+    parser.add_argument('--series', default=','.join(SERIES))
+    parser.add_argument('--formats', default='csv', help="Định dạng export, ví dụ csv,excel,parquet")
+    parser.add_argument('--no-memory', action='store_true', help="Bỏ lượt đo bộ nhớ đỉnh bằng tracemalloc")
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Mức giảm throughput cho phép")
+    parser.add_argument('--startup', action='store_true', help="Chỉ đo thời gian import các entry point")
+    args = parser.parse_args()
+
+    # Benchmark đo S1, không đo việc ghi log
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ.setdefault('CONSOLE_LOG_LEVEL', 'ERROR')
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    formats = parse_formats(args.formats)
+
+    results = []
+    for module in STARTUP_MODULES:
+        seconds = measure_startup(module)
+        results.append({'series': module, 'candles': 0, 'stage': 'startup', 'seconds': seconds,
+                        'candles_per_sec': None, 'peak_mb': None})
+        print(f"{module:<12} {'':>9} {'startup':<17} {seconds:8.3f}s")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for kind in args.series.split(',') if not args.startup else ():
+            for n in sizes:
+                for row in run_case(kind, n, formats, not args.no_memory, workdir):
+                    results.append(row)
+                    peak = f"{row['peak_mb']:9.1f} MB" if row['peak_mb'] is not None else "        -"
+                    print(f"{row['series']:<12} {row['candles']:>9,} {row['stage']:<17} "
+                          f"{row['seconds']:8.3f}s {row['candles_per_sec']:>14,.0f} nến/s {peak}")
+
+    if args.save_baseline:
+        baseline = {baseline_key(row): baseline_value(row) for row in results}
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"\nĐã lưu baseline vào {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\nChưa có baseline {args.baseline}, chạy với --save-baseline để tạo")
+        return 0
+
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = compare_with_baseline(results, baseline, args.tolerance)
+    if not regressions:
+        print("\n✅ Không có regression so với baseline")
+        return 0
+
+    print(f"\n❌ {len(regressions)} stage chậm hơn baseline quá {args.tolerance:.0%}:")
+    for key, expected, actual in regressions:
+        unit = "s" if key.endswith('/startup') else " nến/s"
+        print(f"- {key}: {actual:,.3f}{unit} (baseline {expected:,.3f})")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,60 @@
+import os
+import pickle
+import zlib
+
+CHECKPOINT_VERSION = 1
+
+
+def save_checkpoint(path, pivots, last_candle_ms, meta=None, extra=None):
+    """
+    Lưu toàn bộ trạng thái PivotData (pivot đã xác nhận, pivot chờ, cửa sổ giá...)
+    cùng thời điểm nến cuối đã xử lý ra file nhị phân nén
+
+    extra: dict các object đi kèm cần khôi phục cùng lúc (ví dụ PivotStore của tester)
+
+    Ghi ra file tạm rồi os.replace để không bao giờ để lại checkpoint hỏng khi bị dừng giữa chừng.
+    """
+    payload = {
+        'version': CHECKPOINT_VERSION,
+        'state': pivots.__dict__,
+        'last_candle_ms': int(last_candle_ms),
+        'meta': meta or {},
+        'extra': extra or {},
+    }
+    data = zlib.compress(pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL))
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return len(data)
+
+
+def load_checkpoint(path, pivots, meta=None):
+    """
+    Khôi phục trạng thái vào pivots (giữ nguyên object, kể cả pivot_data toàn cục)
+
+    Returns:
+    tuple: (epoch ms của nến cuối đã xử lý, dict extra), (None, {}) nếu chưa có checkpoint
+
+    Raises:
+    ValueError: Checkpoint khác phiên bản hoặc khác symbol/interval so với meta
+    """
+    if not os.path.exists(path):
+        return None, {}
+
+    with open(path, 'rb') as f:
+        payload = pickle.loads(zlib.decompress(f.read()))
+
+    if payload.get('version') != CHECKPOINT_VERSION:
+        raise ValueError(f"Checkpoint {path} có phiên bản {payload.get('version')}, cần {CHECKPOINT_VERSION}")
+    for key, value in (meta or {}).items():
+        if payload['meta'].get(key) != value:
+            raise ValueError(f"Checkpoint {path} thuộc {key}={payload['meta'].get(key)}, không phải {value}")
+
+    pivots.__dict__.clear()
+    pivots.__dict__.update(payload['state'])
+    return payload['last_candle_ms'], payload.get('extra', {})
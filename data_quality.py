@@ -0,0 +1,221 @@
+import os
+import numpy as np
+
+from kline_cache import KLINE_COLUMNS
+from timeutil import INTERVAL_MS, DAY_MS
+from pivot_store import ms_to_vn_datetime
+
+# Vị trí cột trong mảng kline (n, 12)
+TIMESTAMP, OPEN, HIGH, LOW, CLOSE = range(5)
+CLOSE_TIME = KLINE_COLUMNS.index('close_time')
+REPAIR_MODES = ('flag', 'ffill')
+# Số ví dụ tối đa cho mỗi loại lỗi khi ghi log
+LOG_EXAMPLES = 5
+
+
+class DataQualityReport:
+    """Kết quả kiểm tra một bộ kline, mọi vị trí lỗi được giữ dạng mảng NumPy"""
+
+    def __init__(self, interval_ms, candles_in):
+        self.interval_ms = interval_ms
+        self.candles_in = candles_in
+        self.candles_out = candles_in
+        self.unsorted = 0
+        self.duplicates = np.empty(0, dtype=np.int64)
+        self.misaligned = np.empty(0, dtype=np.int64)
+        self.invalid = np.empty(0, dtype=np.int64)
+        self.gap_starts = np.empty(0, dtype=np.int64)
+        self.gap_sizes = np.empty(0, dtype=np.int64)
+        self.outlier_wicks = np.empty(0, dtype=np.int64)
+        self.clipped_wicks = 0
+        self.filled = np.empty(0, dtype=np.int64)
+
+    @property
+    def missing_bars(self):
+        return int(self.gap_sizes.sum())
+
+    @property
+    def ok(self):
+        return not any(self.summary()[key] for key in (
+            'unsorted', 'duplicates', 'misaligned', 'invalid', 'gaps', 'outlier_wicks'
+        ))
+
+    def summary(self):
+        return {
+            'candles_in': self.candles_in,
+            'candles_out': self.candles_out,
+            'unsorted': self.unsorted,
+            'duplicates': len(self.duplicates),
+            'misaligned': len(self.misaligned),
+            'invalid': len(self.invalid),
+            'gaps': len(self.gap_starts),
+            'missing_bars': self.missing_bars,
+            'filled_bars': len(self.filled),
+            'outlier_wicks': len(self.outlier_wicks),
+            'clipped_wicks': self.clipped_wicks,
+        }
+
+    def log(self, log_message):
+        """Ghi báo cáo gộp: một dòng cho mỗi loại lỗi kèm vài ví dụ (giờ VN)"""
+        summary = self.summary()
+        if self.ok:
+            log_message(f"✅ Dữ liệu hợp lệ: {summary['candles_in']} nến, không có gap/trùng lặp/wick bất thường", "INFO")
+            return
+        log_message("\n=== Kiểm tra chất lượng dữ liệu ===", "WARNING")
+        log_message(f"Nến vào: {summary['candles_in']}, nến ra: {summary['candles_out']}", "WARNING")
+        if self.unsorted:
+            log_message(f"⚠️ {self.unsorted} nến không theo thứ tự thời gian (đã sắp xếp lại)", "WARNING")
+        for name, label, stamps in (
+            ('duplicates', "nến trùng open time (giữ bản cuối)", self.duplicates),
+            ('misaligned', "nến lệch mốc interval", self.misaligned),
+            ('invalid', "nến giá không hợp lệ (đã bỏ)", self.invalid),
+            ('outlier_wicks', "râu nến bất thường", self.outlier_wicks),
+        ):
+            if summary[name]:
+                examples = ', '.join(ms_to_vn_datetime(int(ms)) for ms in stamps[:LOG_EXAMPLES])
+                log_message(f"⚠️ {summary[name]} {label}: {examples}", "WARNING")
+        if summary['gaps']:
+            examples = ', '.join(
+                f"{ms_to_vn_datetime(int(ms))} (+{int(size)})"
+                for ms, size in zip(self.gap_starts[:LOG_EXAMPLES], self.gap_sizes[:LOG_EXAMPLES])
+            )
+            action = f"đã điền {summary['filled_bars']} nến" if summary['filled_bars'] else "chỉ đánh dấu"
+            log_message(f"⚠️ {summary['gaps']} gap, thiếu {summary['missing_bars']} nến ({action}): {examples}", "WARNING")
+        if self.clipped_wicks:
+            log_message(f"✂️ Đã cắt {self.clipped_wicks} râu nến bất thường", "WARNING")
+
+
+def repair_klines(klines, interval, mode='flag', wick_factor=20.0, clip_wicks=False):
+    """
+    Kiểm tra và sửa kline (mảng (n, 12) như KlineCache.get_klines) bằng các phép toán vector
+
+    - Sắp xếp theo open time, bỏ nến trùng (giữ bản cuối), bỏ nến giá <= 0 hoặc high < low
+    - Gap: khoảng cách open time lớn hơn interval. mode='ffill' chèn nến phẳng ở giá close
+      trước đó (volume 0), mode='flag' chỉ báo cáo
+    - Râu nến bất thường: phần râu ngoài thân nến lớn hơn wick_factor lần biên độ trung vị,
+      clip_wicks=True cắt về đúng ngưỡng đó
+
+    Returns:
+    tuple: (mảng kline đã sửa, DataQualityReport)
+    """
+    if mode not in REPAIR_MODES:
+        raise ValueError(f"Chế độ sửa dữ liệu {mode} không hợp lệ, chọn một trong {REPAIR_MODES}")
+    interval_ms = INTERVAL_MS[interval] if isinstance(interval, str) else int(interval)
+    data = np.asarray(klines, dtype=np.float64).reshape(-1, len(KLINE_COLUMNS))
+    report = DataQualityReport(interval_ms, len(data))
+    if not len(data):
+        return data, report
+
+    timestamps = data[:, TIMESTAMP].astype(np.int64)
+    deltas = np.diff(timestamps)
+    if (deltas < 0).any():
+        report.unsorted = int((deltas < 0).sum())
+        order = np.argsort(timestamps, kind='stable')
+        data = data[order]
+        timestamps = timestamps[order]
+        deltas = np.diff(timestamps)
+
+    # Bỏ nến giá lỗi trước, để một bản trùng hỏng không kéo theo bản hợp lệ cùng open time
+    high, low = data[:, HIGH], data[:, LOW]
+    prices = data[:, OPEN:CLOSE + 1]
+    invalid = (prices <= 0).any(axis=1) | ~np.isfinite(prices).all(axis=1) | (high < low)
+    report.invalid = timestamps[invalid]
+    if invalid.any():
+        data = data[~invalid]
+        timestamps = timestamps[~invalid]
+        deltas = np.diff(timestamps)
+
+    # Nến trùng: giữ nến cuối của mỗi open time (bản tải sau thường đầy đủ hơn)
+    duplicate = np.zeros(len(data), dtype=bool)
+    duplicate[:-1] = deltas == 0
+    report.duplicates = timestamps[duplicate]
+    if duplicate.any():
+        data = data[~duplicate]
+        timestamps = timestamps[~duplicate]
+        deltas = np.diff(timestamps)
+
+    # Binance mở nến tuần vào thứ Hai, các interval khác căn theo epoch
+    align_ms = 4 * DAY_MS if interval_ms == INTERVAL_MS['1w'] else 0
+    report.misaligned = timestamps[(timestamps - align_ms) % interval_ms != 0]
+
+    gap = deltas > interval_ms
+    report.gap_starts = timestamps[:-1][gap] + interval_ms
+    report.gap_sizes = (deltas[gap] - 1) // interval_ms
+
+    # Râu nến so với biên độ trung vị của cả bộ dữ liệu
+    body_high = np.maximum(data[:, OPEN], data[:, CLOSE])
+    body_low = np.minimum(data[:, OPEN], data[:, CLOSE])
+    median_range = float(np.median(data[:, HIGH] - data[:, LOW])) if len(data) else 0.0
+    if median_range > 0:
+        limit = wick_factor * median_range
+        upper = data[:, HIGH] - body_high > limit
+        lower = body_low - data[:, LOW] > limit
+        outlier = upper | lower
+        report.outlier_wicks = timestamps[outlier]
+        if clip_wicks and outlier.any():
+            # Không sửa mảng của bên gọi (có thể là memmap của KlineCache)
+            data = data.copy()
+            data[upper, HIGH] = body_high[upper] + limit
+            data[lower, LOW] = body_low[lower] - limit
+            report.clipped_wicks = int(outlier.sum())
+
+    # Nến lệch lưới thời gian sẽ đè lên vị trí của nến khác, khi đó chỉ đánh dấu gap
+    offgrid = ((timestamps - timestamps[0]) % interval_ms != 0).any() if len(data) else True
+    if mode == 'ffill' and len(report.gap_starts) and not offgrid:
+        # Dựng lưới thời gian đầy đủ, nến thiếu lấy close của nến thật gần nhất phía trước
+        positions = (timestamps - timestamps[0]) // interval_ms
+        total = int(positions[-1]) + 1
+        source = np.full(total, -1, dtype=np.int64)
+        source[positions] = np.arange(len(data))
+        source = np.maximum.accumulate(source)
+        filled = np.ones(total, dtype=bool)
+        filled[positions] = False
+
+        grid = timestamps[0] + np.arange(total, dtype=np.int64) * interval_ms
+        repaired = np.zeros((total, len(KLINE_COLUMNS)), dtype=np.float64)
+        repaired[~filled] = data
+        previous_close = data[source[filled], CLOSE]
+        repaired[filled, OPEN] = previous_close
+        repaired[filled, HIGH] = previous_close
+        repaired[filled, LOW] = previous_close
+        repaired[filled, CLOSE] = previous_close
+        repaired[filled, TIMESTAMP] = grid[filled]
+        repaired[filled, CLOSE_TIME] = grid[filled] + interval_ms - 1
+        report.filled = grid[filled]
+        data = repaired
+
+    report.candles_out = len(data)
+    return data, report
+
+
+class DataQualityPolicy:
+    """Cấu hình bước kiểm tra dữ liệu giữa lúc lấy kline và lúc đưa nến vào S1"""
+
+    def __init__(self, mode='flag', wick_factor=20.0, clip_wicks=False):
+        self.mode = mode
+        self.wick_factor = wick_factor
+        self.clip_wicks = clip_wicks
+
+    @classmethod
+    def from_env(cls):
+        """
+        S1_DATA_REPAIR: off, flag (mặc định, chỉ báo cáo gap) hoặc ffill (điền nến thiếu)
+        S1_WICK_FACTOR: ngưỡng râu nến bất thường theo bội số biên độ trung vị (mặc định 20)
+        S1_CLIP_WICKS=1: cắt râu nến bất thường về ngưỡng
+        """
+        return cls(
+            mode=os.environ.get('S1_DATA_REPAIR', 'flag').strip().lower() or 'flag',
+            wick_factor=float(os.environ.get('S1_WICK_FACTOR', 20)),
+            clip_wicks=os.environ.get('S1_CLIP_WICKS', '0') == '1'
+        )
+
+    @property
+    def enabled(self):
+        return self.mode != 'off'
+
+    def apply(self, klines, interval):
+        """Trả về (kline đã sửa, DataQualityReport), report là None khi tắt"""
+        # Interval độ dài không cố định (1M) không kiểm tra được gap theo delta
+        if not self.enabled or (isinstance(interval, str) and interval not in INTERVAL_MS):
+            return klines, None
+        return repair_klines(klines, interval, self.mode, self.wick_factor, self.clip_wicks)
@@ -0,0 +1,62 @@
+import os
+
+# Định dạng cột, Excel được xử lý riêng trong S1HistoricalTester.write_excel_summary
+EXPORT_FORMATS = ('csv', 'parquet', 'arrow')
+FILE_EXTENSIONS = {'csv': 'csv', 'parquet': 'parquet', 'arrow': 'arrow'}
+
+
+def export_csv(frame, path):
+    frame.to_csv(path, index=False)
+
+
+def export_parquet(frame, path):
+    """Cần pyarrow hoặc fastparquet"""
+    frame.to_parquet(path, index=False)
+
+
+def export_arrow(frame, path):
+    """Ghi Arrow IPC (Feather v2), cần pyarrow"""
+    frame.reset_index(drop=True).to_feather(path)
+
+
+EXPORTERS = {
+    'csv': export_csv,
+    'parquet': export_parquet,
+    'arrow': export_arrow,
+}
+
+
+def parse_formats(value):
+    """Đọc danh sách định dạng dạng 'excel,parquet' (ví dụ từ biến môi trường)"""
+    formats = [fmt.strip().lower() for fmt in value.split(',') if fmt.strip()]
+    unknown = [fmt for fmt in formats if fmt != 'excel' and fmt not in EXPORTERS]
+    if unknown:
+        raise ValueError(f"Định dạng export không hỗ trợ: {unknown}")
+    return formats
+
+
+def export_frames(frames, fmt, base_path):
+    """
+    Ghi từng DataFrame ra file {base_path}_{name}.{ext}
+
+    Parameters:
+    frames (dict): Tên -> DataFrame, ví dụ {'pivots': pivot_df, 'candles': df}
+    fmt (str): Một trong EXPORT_FORMATS
+    base_path (str): Đường dẫn không có phần mở rộng
+
+    Returns:
+    list: Các file đã ghi
+    """
+    if fmt not in EXPORTERS:
+        raise ValueError(f"Định dạng export không hỗ trợ: {fmt}")
+
+    directory = os.path.dirname(base_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    written = []
+    for name, frame in frames.items():
+        path = f"{base_path}_{name}.{FILE_EXTENSIONS[fmt]}"
+        EXPORTERS[fmt](frame, path)
+        written.append(path)
+    return written
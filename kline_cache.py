@@ -0,0 +1,137 @@
+import os
+from datetime import datetime, timezone
+import numpy as np
+
+from timeutil import DAY_MS
+
+DEFAULT_CACHE_DIR = "kline_cache"
+
+# Thứ tự cột giống dữ liệu trả về từ Client.get_historical_klines
+KLINE_COLUMNS = [
+    'timestamp', 'open', 'high', 'low', 'close',
+    'volume', 'close_time', 'quote_volume', 'trades',
+    'buy_base_volume', 'buy_quote_volume', 'ignore'
+]
+
+
+def to_ms(value):
+    """Chuyển start_str/end_str (int ms, chuỗi số hoặc datetime UTC) sang epoch ms"""
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return int(value.timestamp() * 1000)
+    return int(value)
+
+
+class KlineCache:
+    """
+    Kho kline trên đĩa, mỗi file .npy chứa một ngày UTC của một cặp (symbol, interval).
+
+    Chỉ những ngày chưa có trong cache mới được tải từ client, các khung thời gian
+    chồng lấn được đọc lại từ đĩa bằng memory-map. client_factory chỉ được gọi (tạo
+    kết nối) ở lần đầu cần tải dữ liệu. Không có client thì cache chạy
+    offline và báo lỗi khi thiếu dữ liệu.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, client=None, client_factory=None):
+        self.cache_dir = cache_dir
+        self._client = client
+        self.client_factory = client_factory
+
+    @property
+    def client(self):
+        if self._client is None and self.client_factory is not None:
+            self._client = self.client_factory()
+        return self._client
+
+    @client.setter
+    def client(self, client):
+        self._client = client
+
+    def _day_path(self, symbol, interval, day_start_ms):
+        day = datetime.fromtimestamp(day_start_ms / 1000, tz=timezone.utc).strftime('%Y%m%d')
+        return os.path.join(self.cache_dir, symbol, interval, f"{day}.npy")
+
+    def missing_days(self, symbol, interval, start_ms, end_ms):
+        """Danh sách ngày (epoch ms 00:00 UTC) trong khoảng chưa có trên đĩa"""
+        first_day = start_ms - start_ms % DAY_MS
+        return [
+            day for day in range(first_day, end_ms + 1, DAY_MS)
+            if not os.path.exists(self._day_path(symbol, interval, day))
+        ]
+
+    def _fetch_days(self, symbol, interval, days):
+        """Tải các ngày còn thiếu, gộp các ngày liên tiếp thành một request"""
+        if self.client is None:
+            raise FileNotFoundError(
+                f"Thiếu dữ liệu {symbol} {interval} trong cache ({len(days)} ngày) khi chạy offline"
+            )
+
+        fetched = {}
+        now_ms = int(datetime.now(timezone.utc).timestamp() * 1000)
+        run_start = 0
+        while run_start < len(days):
+            run_end = run_start
+            while run_end + 1 < len(days) and days[run_end + 1] == days[run_end] + DAY_MS:
+                run_end += 1
+
+            range_start = days[run_start]
+            range_end = days[run_end] + DAY_MS - 1
+            klines = self.client.get_historical_klines(
+                symbol, interval,
+                start_str=range_start,
+                end_str=range_end
+            )
+            data = np.array(klines, dtype=np.float64).reshape(-1, len(KLINE_COLUMNS))
+
+            # Tách theo ngày, chỉ lưu những ngày đã kết thúc để tránh cache nến dở dang
+            day_index = (data[:, 0] // DAY_MS).astype(np.int64) * DAY_MS
+            for day in days[run_start:run_end + 1]:
+                day_data = data[day_index == day]
+                fetched[day] = day_data
+                if day + DAY_MS <= now_ms:
+                    path = self._day_path(symbol, interval, day)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    # Ghi ra file tạm riêng của process rồi os.replace (như checkpoint), process khác
+                    # chạy cùng symbol/interval không bao giờ thấy file .npy ghi dở
+                    tmp_path = f"{path}.{os.getpid()}.tmp"
+                    with open(tmp_path, 'wb') as f:
+                        np.save(f, day_data)
+                    os.replace(tmp_path, path)
+
+            run_start = run_end + 1
+        return fetched
+
+    def get_klines(self, symbol, interval, start_ms, end_ms):
+        """Trả về mảng (n, 12) float64 các nến có open time trong [start_ms, end_ms]"""
+        start_ms, end_ms = to_ms(start_ms), to_ms(end_ms)
+        missing = self.missing_days(symbol, interval, start_ms, end_ms)
+        fetched = self._fetch_days(symbol, interval, missing) if missing else {}
+
+        chunks = []
+        first_day = start_ms - start_ms % DAY_MS
+        for day in range(first_day, end_ms + 1, DAY_MS):
+            if day in fetched:
+                chunks.append(fetched[day])
+            else:
+                chunks.append(np.load(self._day_path(symbol, interval, day), mmap_mode='r'))
+
+        if not chunks:
+            return np.empty((0, len(KLINE_COLUMNS)), dtype=np.float64)
+        data = np.concatenate(chunks)
+        mask = (data[:, 0] >= start_ms) & (data[:, 0] <= end_ms)
+        return data[mask]
+
+
+class ReplayClient:
+    """Thay thế binance Client khi chạy offline, phát lại kline từ KlineCache"""
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def ping(self):
+        return {}
+
+    def get_historical_klines(self, symbol, interval, start_str=None, end_str=None, **kwargs):
+        end_ms = to_ms(end_str) if end_str is not None else int(datetime.now(timezone.utc).timestamp() * 1000)
+        return self.cache.get_klines(symbol, interval, to_ms(start_str), end_ms).tolist()
@@ -0,0 +1,213 @@
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+from kline_cache import KLINE_COLUMNS, KlineCache, DEFAULT_CACHE_DIR, to_ms
+from timeutil import INTERVAL_MS
+
+BASE_URL = "https://api.binance.com"
+KLINES_PATH = "/api/v3/klines"
+PING_PATH = "/api/v3/ping"
+PAGE_LIMIT = 1000
+# Weight của /api/v3/klines với limit 1000, giới hạn của Binance là 6000/phút theo IP
+KLINES_WEIGHT = 2
+WEIGHT_LIMIT = 6000
+WEIGHT_HEADER = "X-MBX-USED-WEIGHT-1M"
+
+
+class WeightLimiter:
+    """
+    Giới hạn weight theo cửa sổ 1 phút như Binance
+
+    Weight được giữ chỗ trước mỗi request, sau đó đồng bộ với header X-MBX-USED-WEIGHT-1M
+    (số server đếm, gồm cả các tiến trình khác dùng chung IP).
+    """
+
+    def __init__(self, limit=WEIGHT_LIMIT, safety=0.9):
+        self.limit = int(limit * safety)
+        self.used = 0
+        self.window = None
+        # Hết hạn Retry-After (epoch giây), không thread nào gửi request trước thời điểm này
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def _current_window(self):
+        return int(time.time() // 60)
+
+    def acquire(self, weight):
+        while True:
+            with self.lock:
+                now = time.time()
+                if now < self.blocked_until:
+                    wait = self.blocked_until - now
+                else:
+                    window = self._current_window()
+                    if window != self.window:
+                        self.window = window
+                        self.used = 0
+                    if self.used + weight <= self.limit:
+                        self.used += weight
+                        return
+                    wait = (window + 1) * 60 - now
+            time.sleep(max(wait, 0.05))
+
+    def update(self, used_weight):
+        """Cập nhật theo số weight server báo về"""
+        with self.lock:
+            if self.window == self._current_window():
+                self.used = max(self.used, int(used_weight))
+
+    def block_for(self, seconds):
+        """Dừng mọi request (của mọi thread) cho đến khi hết thời gian Retry-After"""
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.time() + seconds)
+
+
+class KlineDownloader:
+    """
+    Tải kline qua REST API, chia khoảng thời gian thành các trang và tải song song
+    trên một requests.Session có connection pool
+
+    Có cùng giao diện get_historical_klines/ping với binance Client nên dùng được làm
+    client của KlineCache. base_url đổi được để chạy với mock server.
+    """
+
+    def __init__(self, base_url=BASE_URL, max_workers=8, limit=PAGE_LIMIT,
+                 weight_limit=WEIGHT_LIMIT, session=None, timeout=10, max_retries=5):
+        self.base_url = base_url.rstrip('/')
+        self.max_workers = max_workers
+        self.page_limit = limit
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.limiter = WeightLimiter(weight_limit)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        self.session = session
+
+    @classmethod
+    def from_env(cls):
+        """BINANCE_BASE_URL, KLINE_DOWNLOAD_WORKERS, BINANCE_WEIGHT_LIMIT"""
+        return cls(
+            base_url=os.environ.get('BINANCE_BASE_URL', BASE_URL),
+            max_workers=int(os.environ.get('KLINE_DOWNLOAD_WORKERS', 8)),
+            weight_limit=int(os.environ.get('BINANCE_WEIGHT_LIMIT', WEIGHT_LIMIT))
+        )
+
+    def _get(self, path, params=None, weight=1):
+        url = f"{self.base_url}{path}"
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire(weight)
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+            except requests.RequestException:
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(min(2 ** attempt, 30))
+                continue
+
+            used = response.headers.get(WEIGHT_HEADER)
+            if used is not None:
+                self.limiter.update(used)
+            # 429: vượt giới hạn, 418: IP bị chặn tạm thời, cả hai đều có Retry-After
+            if response.status_code in (418, 429) and attempt < self.max_retries:
+                self.limiter.block_for(float(response.headers.get('Retry-After', 60)))
+                continue
+            if response.status_code >= 500 and attempt < self.max_retries:
+                time.sleep(min(2 ** attempt, 30))
+                continue
+            response.raise_for_status()
+            return response.json()
+
+    def ping(self):
+        return self._get(PING_PATH)
+
+    def page_ranges(self, interval, start_ms, end_ms):
+        """Chia [start_ms, end_ms] thành các khoảng, mỗi khoảng vừa một trang page_limit nến"""
+        step = INTERVAL_MS[interval] * self.page_limit
+        return [(page_start, min(page_start + step - 1, end_ms)) for page_start in range(start_ms, end_ms + 1, step)]
+
+    def fetch_page(self, symbol, interval, start_ms, end_ms):
+        """Tải một khoảng, tiếp tục trang sau nếu server trả về ít nến hơn khoảng yêu cầu"""
+        rows = []
+        while start_ms <= end_ms:
+            page = self._get(KLINES_PATH, params={
+                'symbol': symbol,
+                'interval': interval,
+                'startTime': start_ms,
+                'endTime': end_ms,
+                'limit': self.page_limit,
+            }, weight=KLINES_WEIGHT)
+            if not page:
+                break
+            rows.extend(page)
+            if len(page) < self.page_limit:
+                break
+            start_ms = int(page[-1][0]) + 1
+        return rows
+
+    def get_klines(self, symbol, interval, start_ms, end_ms):
+        """
+        Tải song song mọi trang trong [start_ms, end_ms]
+
+        Returns:
+        Mảng (n, 12) float64 sắp xếp theo open time, không trùng lặp
+        """
+        start_ms, end_ms = to_ms(start_ms), to_ms(end_ms)
+        ranges = self.page_ranges(interval, start_ms, end_ms)
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, max(len(ranges), 1))) as executor:
+            pages = list(executor.map(lambda r: self.fetch_page(symbol, interval, *r), ranges))
+
+        rows = [row for page in pages for row in page]
+        if not rows:
+            return np.empty((0, len(KLINE_COLUMNS)), dtype=np.float64)
+        data = np.array(rows, dtype=np.float64).reshape(-1, len(KLINE_COLUMNS))
+        # Các trang có thể chồng nhau ở biên, giữ một nến cho mỗi open time
+        _, first = np.unique(data[:, 0], return_index=True)
+        return data[first]
+
+    def get_historical_klines(self, symbol, interval, start_str=None, end_str=None, **kwargs):
+        end_ms = to_ms(end_str) if end_str is not None else int(datetime.now(timezone.utc).timestamp() * 1000)
+        return self.get_klines(symbol, interval, to_ms(start_str), end_ms).tolist()
+
+
+def backfill(symbols, interval, start_ms, end_ms, cache_dir=DEFAULT_CACHE_DIR, downloader=None):
+    """Tải trước dữ liệu của nhiều symbol vào KlineCache, trả về số nến mỗi symbol"""
+    cache = KlineCache(cache_dir, downloader or KlineDownloader.from_env())
+    return {symbol: len(cache.get_klines(symbol, interval, start_ms, end_ms)) for symbol in symbols}
+
+
+def main():
+    """
+    Ví dụ: python kline_downloader.py BTCUSDT,ETHUSDT 1m "2024-01-01 00:00:00" "2025-01-01 00:00:00"
+
+    Thời gian theo UTC. Dữ liệu được lưu vào KLINE_CACHE_DIR (mặc định kline_cache).
+    """
+    if len(sys.argv) < 5:
+        print(main.__doc__)
+        return None
+
+    symbols = sys.argv[1].split(',')
+    interval = sys.argv[2]
+    start_ms = to_ms(datetime.strptime(sys.argv[3], '%Y-%m-%d %H:%M:%S'))
+    end_ms = to_ms(datetime.strptime(sys.argv[4], '%Y-%m-%d %H:%M:%S'))
+
+    started = time.perf_counter()
+    counts = backfill(symbols, interval, start_ms, end_ms,
+                      cache_dir=os.environ.get('KLINE_CACHE_DIR', DEFAULT_CACHE_DIR))
+    for symbol, count in counts.items():
+        print(f"{symbol} {interval}: {count:,} nến")
+    print(f"Hoàn tất sau {time.perf_counter() - started:.1f}s")
+    return counts
+
+
+if __name__ == "__main__":
+    main()
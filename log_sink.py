@@ -0,0 +1,169 @@
+import atexit
+import os
+import queue
+import threading
+from datetime import datetime
+
+# Thứ tự level, level thấp hơn ngưỡng sẽ bị bỏ qua ngay khi gọi
+LOG_LEVELS = {
+    'DEBUG': 10,
+    'DETAIL': 10,
+    'INFO': 20,
+    # Log của chính S1 (s1.save_log), chỉ ghi file
+    'S1': 20,
+    'SUCCESS': 25,
+    'SUMMARY': 25,
+    'WARNING': 30,
+    'ERROR': 40,
+}
+
+_TRUNCATE = object()
+_STOP = object()
+
+
+def level_value(level):
+    """Giá trị số của level, level lạ được coi như INFO"""
+    if isinstance(level, int):
+        return level
+    return LOG_LEVELS.get(str(level).upper(), LOG_LEVELS['INFO'])
+
+
+class LogSink:
+    """
+    Bộ ghi log dùng chung cho test_s1 và s1.
+
+    Message được lọc theo level rồi đẩy vào hàng đợi, một thread nền gom
+    thành lô và ghi xuống file, file chỉ được mở một lần cho mỗi lô.
+    """
+
+    def __init__(self, log_file, level='INFO', console_level=None,
+                 batch_size=500, flush_interval=0.5):
+        self.log_file = log_file
+        self.min_level = level_value(level)
+        self.console_level = level_value(console_level if console_level is not None else level)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="log-sink", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def enabled(self, level):
+        """Kiểm tra nhanh level có được ghi không, dùng để bỏ qua việc format message"""
+        return level_value(level) >= min(self.min_level, self.console_level)
+
+    def log(self, message, level="INFO", log_file=None, console=True):
+        """Ghi log ra console (trừ khi console=False) và file với level"""
+        levelno = level_value(level)
+        to_console = console and levelno >= self.console_level
+        if levelno < self.min_level and not to_console:
+            return
+
+        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        formatted_message = f"[{timestamp}] [{level}] {message}"
+        if to_console:
+            print(formatted_message)
+        if levelno >= self.min_level:
+            self._queue.put((log_file or self.log_file, formatted_message))
+
+    def save_log(self, message, log_file=None):
+        """Tương thích chữ ký s1.save_log(message, log_file), chỉ ghi file như s1.save_log gốc"""
+        self.log(message, "S1", log_file, console=False)
+
+    def reset(self, header='=== Log Initialized ===', log_file=None):
+        """Xóa nội dung file log, thực hiện theo đúng thứ tự trong hàng đợi"""
+        self._queue.put((log_file or self.log_file, (_TRUNCATE, header)))
+
+    def flush(self):
+        """Chờ tới khi mọi message đã nằm trong file"""
+        if self._thread.is_alive():
+            self._queue.join()
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+
+    def _run(self):
+        handles = {}
+        try:
+            while True:
+                try:
+                    item = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    continue
+
+                batch = [item]
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+
+                stop = self._write_batch(batch, handles)
+                for _ in batch:
+                    self._queue.task_done()
+                if stop:
+                    break
+        finally:
+            for handle in handles.values():
+                handle.close()
+
+    def _write_batch(self, batch, handles):
+        pending = {}
+        stop = False
+        for item in batch:
+            if item is _STOP:
+                stop = True
+                continue
+            path, line = item
+            if isinstance(line, tuple) and line[0] is _TRUNCATE:
+                # Ghi phần đang chờ của file trước, sau đó mở lại ở chế độ 'w'
+                self._write_lines(path, pending.pop(path, []), handles)
+                if path in handles:
+                    handles.pop(path).close()
+                try:
+                    handles[path] = open(path, 'w', encoding='utf-8')
+                    handles[path].write(f"{line[1]}\n")
+                except Exception as e:
+                    print(f"Error clearing log file: {str(e)}")
+                continue
+            pending.setdefault(path, []).append(line)
+
+        for path, lines in pending.items():
+            self._write_lines(path, lines, handles)
+        for handle in handles.values():
+            handle.flush()
+        return stop
+
+    def _write_lines(self, path, lines, handles):
+        if not lines:
+            return
+        try:
+            if path not in handles:
+                handles[path] = open(path, 'a', encoding='utf-8')
+            handles[path].write("\n".join(lines) + "\n")
+        except Exception as e:
+            print(f"Error writing log file {path}: {str(e)}")
+
+
+_sinks = {}
+
+
+def get_sink(log_file):
+    """LogSink dùng chung cho mỗi file, level lấy từ LOG_LEVEL / CONSOLE_LOG_LEVEL"""
+    if log_file not in _sinks:
+        level = os.environ.get('LOG_LEVEL', 'DEBUG')
+        _sinks[log_file] = LogSink(
+            log_file,
+            level=level,
+            console_level=os.environ.get('CONSOLE_LOG_LEVEL', level)
+        )
+    return _sinks[log_file]
+
+
+def route_s1_logs(sink):
+    """Chuyển s1.save_log sang sink để hai module dùng chung một bộ ghi"""
+    import s1
+    # s1 tra save_log qua biến global của module nên gán lại là đủ
+    s1.save_log = sink.save_log
@@ -0,0 +1,252 @@
+import os
+import sys
+import traceback
+from collections import deque
+from datetime import datetime
+
+from pivot_store import PivotStore, PIVOT_TYPES, resolve_pivot_timestamp, seed_initial_pivots
+from timeutil import DAY_MS, INTERVAL_MS, VN_OFFSET_MS, make_price_data, split_ms
+
+DEFAULT_TIMEFRAMES = ('30m', '1h', '4h', '1d')
+# Binance mở nến tuần vào thứ Hai 00:00 UTC, 1970-01-01 là thứ Năm
+WEEK_ALIGN_MS = 4 * DAY_MS
+# Số nến gần nhất của mỗi khung giữ lại để xác định ngày của pivot chỉ có HH:MM
+RECENT_BARS = 500
+
+
+class CandleAggregator:
+    """
+    Gộp dần nến khung nhỏ thành nến khung lớn (high/low/close), căn theo giờ UTC như Binance
+
+    add() trả về nến khung lớn ngay khi nến nhỏ cuối cùng của nó đến, không cần chờ nến kế tiếp.
+    Nếu dữ liệu bị thiếu nến, nến khung lớn dở dang được trả về khi nến nhỏ đầu tiên của
+    khung sau xuất hiện.
+    """
+
+    __slots__ = ('interval_ms', 'base_ms', 'align_ms', 'bar')
+
+    def __init__(self, interval_ms, base_ms, align_ms=0):
+        self.interval_ms = interval_ms
+        self.base_ms = base_ms
+        self.align_ms = align_ms
+        self.bar = None
+
+    def add(self, timestamp, high, low, close):
+        """Returns: list các nến (timestamp, high, low, close) đã đóng, thường rỗng hoặc một phần tử"""
+        bucket = timestamp - (timestamp - self.align_ms) % self.interval_ms
+        closed = []
+        bar = self.bar
+        if bar is not None and bar[0] != bucket:
+            closed.append(tuple(bar))
+            bar = None
+        if bar is None:
+            bar = [bucket, high, low, close]
+        else:
+            if high > bar[1]:
+                bar[1] = high
+            if low < bar[2]:
+                bar[2] = low
+            bar[3] = close
+
+        if timestamp + self.base_ms >= bucket + self.interval_ms:
+            closed.append(tuple(bar))
+            bar = None
+        self.bar = bar
+        return closed
+
+    def flush(self):
+        """Nến dở dang cuối cùng (nếu có)"""
+        bar, self.bar = self.bar, None
+        return [tuple(bar)] if bar is not None else []
+
+
+class MultiTimeframeEngine:
+    """
+    Một lượt duyệt nến khung nhỏ nhất cho ra pivot của mọi khung thời gian
+
+    Mỗi khung có PivotData, CandleAggregator và PivotStore riêng. Khung cơ sở được
+    cung cấp trực tiếp, các khung lớn hơn nhận nến ngay khi được gộp xong.
+    """
+
+    def __init__(self, base_interval='30m', timeframes=DEFAULT_TIMEFRAMES, pivots_factory=None):
+        if pivots_factory is None:
+            from s1 import PivotData
+            pivots_factory = PivotData
+
+        base_ms = INTERVAL_MS[base_interval]
+        self.base_interval = base_interval
+        self.timeframes = []
+        self.aggregators = {}
+        for interval in timeframes:
+            interval_ms = INTERVAL_MS[interval]
+            if interval_ms < base_ms or interval_ms % base_ms:
+                raise ValueError(f"Không thể gộp {base_interval} thành {interval}")
+            self.timeframes.append(interval)
+            if interval_ms != base_ms:
+                align_ms = WEEK_ALIGN_MS if interval == '1w' else 0
+                self.aggregators[interval] = CandleAggregator(interval_ms, base_ms, align_ms)
+
+        self.pivots = {interval: pivots_factory() for interval in self.timeframes}
+        self.stores = {interval: PivotStore() for interval in self.timeframes}
+        self.recent_bars = {interval: deque(maxlen=RECENT_BARS) for interval in self.timeframes}
+        self.bar_counts = dict.fromkeys(self.timeframes, 0)
+        self._confirmed = {interval: 0 for interval in self.timeframes}
+
+    def reset(self, initial_pivots=None):
+        """
+        clear_all cho mọi khung và thêm pivot khởi tạo
+
+        initial_pivots: {interval: [pivot giờ VN, ...]}, khung không có trong dict bắt đầu trống
+        """
+        for interval in self.timeframes:
+            pivots = self.pivots[interval]
+            pivots.clear_all()
+            store = self.stores[interval]
+            store.clear()
+            seeds = (initial_pivots or {}).get(interval)
+            if seeds:
+                seed_initial_pivots(pivots, seeds)
+                for pivot in seeds:
+                    store.add_pivot(pivot)
+            self._confirmed[interval] = len(pivots.confirmed_pivots)
+            self.recent_bars[interval].clear()
+            self.bar_counts[interval] = 0
+        for aggregator in self.aggregators.values():
+            aggregator.bar = None
+
+    def _resolve_timestamp(self, interval, pivot, candle_ms):
+        """Epoch ms của pivot: khớp HH:MM và giá với các nến gần nhất của khung, từ mới đến cũ"""
+        hour, minute = pivot['time'].split(':')
+        target_minute = int(hour) * 60 + int(minute)
+        price = pivot['price']
+        fallback = None
+        for timestamp, high, low in reversed(self.recent_bars[interval]):
+            if split_ms(timestamp, VN_OFFSET_MS)[1] == target_minute:
+                if price == high or price == low:
+                    return timestamp
+                if fallback is None:
+                    fallback = timestamp
+        return fallback if fallback is not None else resolve_pivot_timestamp(pivot['time'], candle_ms)
+
+    def _feed(self, interval, bar):
+        timestamp, high, low, close = bar
+        day, minute = split_ms(timestamp, VN_OFFSET_MS)
+        pivots = self.pivots[interval]
+        self.recent_bars[interval].append((timestamp, high, low))
+        self.bar_counts[interval] += 1
+        pivots.process_new_data(make_price_data(day, minute, close, high, low))
+
+        confirmed_pivots = pivots.confirmed_pivots
+        start = self._confirmed[interval]
+        if len(confirmed_pivots) != start:
+            store = self.stores[interval]
+            for pivot in confirmed_pivots[start:]:
+                if pivot.get('vn_datetime') or pivot.get('vn_date'):
+                    store.add_pivot(pivot)
+                else:
+                    store.append(self._resolve_timestamp(interval, pivot, timestamp), pivot['price'], pivot['type'])
+            self._confirmed[interval] = len(confirmed_pivots)
+
+    def process_candle(self, timestamp, high, low, close):
+        """Nhận một nến khung cơ sở (đã đóng), cung cấp cho mọi khung có nến mới đóng"""
+        for interval in self.timeframes:
+            aggregator = self.aggregators.get(interval)
+            if aggregator is None:
+                self._feed(interval, (timestamp, high, low, close))
+            else:
+                for bar in aggregator.add(timestamp, high, low, close):
+                    self._feed(interval, bar)
+
+    def run(self, df, flush=False):
+        """
+        Duyệt một lần qua DataFrame nến khung cơ sở (S1HistoricalTester.load_candles)
+
+        flush: cung cấp luôn các nến khung lớn còn dở dang ở cuối dữ liệu
+        """
+        process_candle = self.process_candle
+        for timestamp, high, low, close in zip(
+            df['timestamp'].tolist(), df['high'].tolist(), df['low'].tolist(), df['price'].tolist()
+        ):
+            process_candle(timestamp, high, low, close)
+        if flush:
+            for interval, aggregator in self.aggregators.items():
+                for bar in aggregator.flush():
+                    self._feed(interval, bar)
+
+    def summary(self):
+        """Một dòng thống kê cho mỗi khung: số nến, số pivot theo loại"""
+        rows = []
+        for interval in self.timeframes:
+            store = self.stores[interval]
+            row = {'interval': interval, 'bars': self.bar_counts[interval], 'pivots': len(store)}
+            types = store.types.tolist()
+            for code, ptype in enumerate(PIVOT_TYPES):
+                row[ptype] = types.count(code)
+            rows.append(row)
+        return rows
+
+    def pivot_frames(self):
+        """{'pivots_<interval>': DataFrame} để dùng với exporters.export_frames"""
+        import pandas as pd
+
+        frames = {}
+        for interval in self.timeframes:
+            store = self.stores[interval]
+            frames[f"pivots_{interval}"] = pd.DataFrame({
+                'datetime': pd.to_datetime(store.timestamps + VN_OFFSET_MS, unit='ms'),
+                'price': store.prices,
+                'type': [PIVOT_TYPES[code] for code in store.types.tolist()],
+            })
+        return frames
+
+
+def main():
+    """
+    Ví dụ: python multi_timeframe.py "2025-03-01 00:00:00" "2025-03-16 12:00:00" [30m,1h,4h,1d]
+
+    Thời gian theo UTC. Chỉ tải khung nhỏ nhất, các khung khác được gộp từ đó.
+    """
+    if len(sys.argv) < 3:
+        print(main.__doc__)
+        return None
+
+    try:
+        from exporters import export_frames, parse_formats
+        from test_s1 import S1HistoricalTester
+
+        start_time = datetime.strptime(sys.argv[1], '%Y-%m-%d %H:%M:%S')
+        end_time = datetime.strptime(sys.argv[2], '%Y-%m-%d %H:%M:%S')
+        timeframes = sys.argv[3].split(',') if len(sys.argv) > 3 else list(DEFAULT_TIMEFRAMES)
+        base_interval = min(timeframes, key=INTERVAL_MS.get)
+
+        tester = S1HistoricalTester(
+            os.environ.get('CURRENT_USER', 'lenhat20791'),
+            offline=os.environ.get('S1_OFFLINE', '0') == '1',
+            interval=base_interval,
+            log_file="debug_multi_timeframe.log"
+        )
+        df = tester.load_candles(start_time, end_time)
+        if df is None:
+            return None
+
+        engine = MultiTimeframeEngine(base_interval, timeframes)
+        engine.reset()
+        engine.run(df)
+
+        for row in engine.summary():
+            counts = ', '.join(f"{ptype}={row[ptype]}" for ptype in PIVOT_TYPES)
+            print(f"{row['interval']:>4}: {row['bars']:,} nến, {row['pivots']} pivot ({counts})")
+        for fmt in parse_formats(os.environ.get('S1_EXPORT_FORMATS', 'csv')):
+            if fmt != 'excel':
+                export_frames(engine.pivot_frames(), fmt, "multi_timeframe")
+        tester.log_sink.flush()
+        return engine
+
+    except Exception as e:
+        print(f"Lỗi: {str(e)}")
+        print(traceback.format_exc())
+        return None
+
+
+if __name__ == "__main__":
+    main()
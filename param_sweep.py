@@ -0,0 +1,247 @@
+import itertools
+import os
+import random
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+SWEEP_REPORT_FILE = "sweep_results.csv"
+# Log S1 của mọi worker ghi chung một file, mặc định chỉ WARNING trở lên
+SWEEP_LOG_FILE = "debug_sweep.log"
+SWEEP_LOG_LEVEL = "WARNING"
+# Số nến chuyển sang đối tượng Python mỗi lần khi đọc cột nến dùng chung
+PRICE_DATA_CHUNK = 4096
+
+# Dữ liệu nến của worker (SharedCandles), attach một lần trong _init_worker và chỉ đọc
+_CANDLES = None
+_INITIAL_PIVOTS = None
+_LOG_SINK = None
+# Giá trị gốc của các hằng số s1 mà cấu hình trước đã đổi trong worker này
+_S1_DEFAULTS = {}
+
+
+def iter_price_data(candles, chunk_size=PRICE_DATA_CHUNK):
+    """
+    Sinh (epoch ms, price_data) cho từng nến
+
+    candles: DataFrame đã chuẩn bị (S1HistoricalTester.load_candles) hoặc SharedCandles.
+    Các cột được đọc theo từng đoạn chunk_size nến, nên mỗi worker chỉ giữ vài nghìn giá trị
+    Python cùng lúc thay vì chép cả cột ra list
+    """
+    import numpy as np
+    from timeutil import make_price_data
+
+    columns = [np.asarray(candles[name]) for name in ('timestamp', 'vn_minute', 'price', 'high', 'low', 'vn_day')]
+    for start in range(0, len(columns[0]), chunk_size):
+        chunk = [column[start:start + chunk_size].tolist() for column in columns]
+        for timestamp, vn_minute, price, high, low, vn_day in zip(*chunk):
+            yield timestamp, make_price_data(vn_day, vn_minute, price, high, low)
+
+
+def grid_configs(param_grid):
+    """Mọi tổ hợp của param_grid {'TÊN_THAM_SỐ': [giá trị, ...]}"""
+    names = list(param_grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(param_grid[name] for name in names))]
+
+
+def random_configs(param_grid, n_samples, seed=None):
+    """
+    Lấy ngẫu nhiên n_samples cấu hình
+
+    Giá trị là list thì chọn một phần tử, là tuple (min, max) thì lấy đều trong khoảng
+    (số nguyên nếu cả hai đầu là int).
+    """
+    rng = random.Random(seed)
+    configs = []
+    for _ in range(n_samples):
+        config = {}
+        for name, values in param_grid.items():
+            if isinstance(values, tuple):
+                low, high = values
+                if isinstance(low, int) and isinstance(high, int):
+                    config[name] = rng.randint(low, high)
+                else:
+                    config[name] = rng.uniform(low, high)
+            else:
+                config[name] = rng.choice(list(values))
+        configs.append(config)
+    return configs
+
+
+def _init_worker(candles_spec, initial_pivots, log_file, log_level):
+    global _CANDLES, _INITIAL_PIVOTS, _LOG_SINK
+    from shared_candles import SharedCandles
+
+    _CANDLES = SharedCandles.attach(candles_spec)
+    _INITIAL_PIVOTS = initial_pivots
+
+    from log_sink import LogSink, route_s1_logs
+    _LOG_SINK = LogSink(log_file, level=log_level)
+    route_s1_logs(_LOG_SINK)
+
+
+def patch_s1_constants(config):
+    """
+    Đặt các hằng số cấp module của s1 (tên viết hoa có trong s1) theo config
+
+    Hằng số của cấu hình trước được trả về giá trị gốc trước, vì worker dùng lại cho nhiều
+    cấu hình. Mỗi worker là một process riêng nên không ảnh hưởng worker khác.
+
+    Returns:
+    dict: Các tham số còn lại, dành cho thuộc tính của PivotData
+    """
+    import s1
+
+    for name, value in _S1_DEFAULTS.items():
+        setattr(s1, name, value)
+    _S1_DEFAULTS.clear()
+
+    attributes = {}
+    for name, value in config.items():
+        if name.isupper() and hasattr(s1, name):
+            _S1_DEFAULTS[name] = getattr(s1, name)
+            setattr(s1, name, value)
+        else:
+            attributes[name] = value
+    return attributes
+
+
+def evaluate_config(config):
+    """Chạy S1 trên toàn bộ nến với một cấu hình, trả về thống kê pivot"""
+    from s1 import PivotData
+    from pivot_store import PivotStore, seed_initial_pivots, record_new_pivots
+
+    # Hằng số module được đặt trước khi tạo PivotData, thuộc tính instance đặt sau clear_all
+    # để clear_all không đưa chúng về mặc định
+    attributes = patch_s1_constants(config)
+    pivots = PivotData()
+    pivots.clear_all()
+    for name, value in attributes.items():
+        if not hasattr(pivots, name):
+            raise ValueError(f"s1 và PivotData không có tham số {name}")
+        setattr(pivots, name, value)
+
+    if _INITIAL_PIVOTS:
+        seed_initial_pivots(pivots, _INITIAL_PIVOTS)
+
+    # Chỉ thống kê pivot S1 tìm được, không tính pivot khởi tạo
+    store = PivotStore()
+    confirmed_count = len(pivots.confirmed_pivots)
+    process_new_data = pivots.process_new_data
+    for candle_ms, price_data in iter_price_data(_CANDLES):
+        process_new_data(price_data)
+        if len(pivots.confirmed_pivots) != confirmed_count:
+            confirmed_count = record_new_pivots(pivots, store, confirmed_count, candle_ms)
+
+    stats = dict(config)
+    stats['pivots'] = len(store)
+    stats.update(store.index.counts)
+
+    # Khoảng cách giữa các pivot liên tiếp (phút), PivotIndex đã cập nhật dần theo thời điểm đầy đủ
+    gaps = store.index.gap_stats()
+    for key in ('avg_gap_minutes', 'min_gap_minutes', 'std_gap_minutes'):
+        stats[key] = gaps[key]
+
+    # Worker của ProcessPoolExecutor thoát không qua atexit nên ghi log xuống file sau mỗi cấu hình
+    if _LOG_SINK is not None:
+        _LOG_SINK.flush()
+    return stats
+
+
+def run_sweep(df, configs, initial_pivots=None, max_workers=None,
+              rank_by=('pivots', 'avg_gap_minutes'), ascending=False, report_file=SWEEP_REPORT_FILE,
+              log_file=SWEEP_LOG_FILE, log_level=SWEEP_LOG_LEVEL):
+    """
+    Đánh giá song song danh sách cấu hình trên cùng một bộ nến
+
+    Các cột nến được chép một lần vào shared memory, worker attach dạng view NumPy
+    (không pickle, không copy) qua initializer, các task chỉ gửi cấu hình.
+
+    Parameters:
+    df (DataFrame): Nến đã chuẩn bị bởi S1HistoricalTester.load_candles
+    configs (list): Các dict {tên hằng số s1 hoặc thuộc tính PivotData: giá trị},
+        xem grid_configs/random_configs
+    rank_by (tuple): Cột dùng để xếp hạng
+    log_file, log_level: File log S1 dùng chung cho các worker (xóa khi bắt đầu sweep) và level tối thiểu
+
+    Returns:
+    DataFrame xếp hạng, mỗi dòng một cấu hình
+    """
+    import pandas as pd
+    from shared_candles import SharedCandles
+
+    # Log của lần sweep trước không còn ý nghĩa với bộ cấu hình mới
+    with open(log_file, 'w', encoding='utf-8') as f:
+        f.write(f"=== Sweep {len(configs)} cấu hình ({datetime.now().strftime('%Y-%m-%d %H:%M:%S')}) ===\n")
+
+    rows = []
+    with SharedCandles.publish(df) as candles, ProcessPoolExecutor(
+        max_workers=max_workers or os.cpu_count(),
+        initializer=_init_worker,
+        initargs=(candles.spec, initial_pivots, log_file, log_level)
+    ) as executor:
+        futures = [executor.submit(evaluate_config, config) for config in configs]
+        for config, future in zip(configs, futures):
+            try:
+                rows.append(future.result())
+            except Exception as e:
+                print(f"❌ Lỗi cấu hình {config}: {str(e)}")
+                print(traceback.format_exc())
+                rows.append(dict(config, error=str(e)))
+
+    table = pd.DataFrame(rows)
+    rank_by = [col for col in rank_by if col in table.columns]
+    if rank_by:
+        table = table.sort_values(rank_by, ascending=ascending, na_position='last')
+    table = table.reset_index(drop=True)
+    table.index.name = 'rank'
+
+    if report_file:
+        table.to_csv(report_file)
+        print(f"Đã lưu kết quả sweep vào {report_file}")
+    return table
+
+
+def main():
+    """
+    Ví dụ: python param_sweep.py "2025-03-14 17:00:00" "2025-03-16 12:00:00" TEN_THUOC_TINH=1,2,3 [RANDOM=n]
+
+    Mỗi tham số là một hằng số cấp module của s1 (tên viết hoa) hoặc một thuộc tính của
+    PivotData, kèm danh sách giá trị cần thử.
+    RANDOM=n lấy ngẫu nhiên n cấu hình thay vì chạy toàn bộ lưới.
+    """
+    if len(sys.argv) < 4:
+        print(main.__doc__)
+        return None
+
+    from test_s1 import S1HistoricalTester
+
+    start_time = datetime.strptime(sys.argv[1], '%Y-%m-%d %H:%M:%S')
+    end_time = datetime.strptime(sys.argv[2], '%Y-%m-%d %H:%M:%S')
+
+    param_grid = {}
+    n_samples = None
+    for arg in sys.argv[3:]:
+        name, values = arg.split('=', 1)
+        if name == 'RANDOM':
+            n_samples = int(values)
+            continue
+        param_grid[name] = [float(v) if '.' in v else int(v) for v in values.split(',')]
+
+    tester = S1HistoricalTester(
+        os.environ.get('CURRENT_USER', 'lenhat20791'),
+        offline=os.environ.get('S1_OFFLINE', '0') == '1'
+    )
+    df = tester.load_candles(start_time, end_time)
+    if df is None:
+        return None
+
+    configs = random_configs(param_grid, n_samples) if n_samples else grid_configs(param_grid)
+    table = run_sweep(df, configs)
+    print(table.to_string())
+    return table
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+import asyncio
+import inspect
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+PIVOT_EVENT_LOG_FILE = "pivot_alerts.jsonl"
+_SEQUENCE = itertools.count(1)
+
+
+class PivotEvent:
+    """Một pivot vừa được PivotData xác nhận"""
+
+    __slots__ = ('sequence', 'key', 'pivot', 'created', 'created_ms')
+
+    def __init__(self, key, pivot):
+        self.sequence = next(_SEQUENCE)
+        self.key = key
+        self.pivot = pivot
+        # perf_counter để đo độ trễ giao hàng, epoch ms để ghi ra ngoài
+        self.created = time.perf_counter()
+        self.created_ms = int(time.time() * 1000)
+
+    @property
+    def pivot_type(self):
+        return self.pivot['type']
+
+    def as_dict(self):
+        key = list(self.key) if isinstance(self.key, tuple) else self.key
+        return {'sequence': self.sequence, 'key': key, 'created_ms': self.created_ms, 'pivot': self.pivot}
+
+
+class PivotEmitter:
+    """
+    Phát sự kiện mỗi khi process_new_data của một PivotData xác nhận pivot mới
+
+    attach() gắn wrapper lên instance (không sửa class s1), so độ dài confirmed_pivots
+    trước và sau mỗi nến rồi gọi các subscriber với PivotEvent. Subscriber chạy ngay trên
+    thread đang xử lý nến nên phải nhanh, AlertPipeline.publish chỉ đẩy vào hàng đợi.
+    """
+
+    def __init__(self):
+        self.subscribers = []
+        self.emitted = 0
+        # Lỗi của subscriber được đếm lại, không làm dừng việc xử lý nến
+        self.errors = 0
+        self.last_error = None
+        self._attached = {}
+
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        self.subscribers.remove(callback)
+
+    def emit(self, key, pivots, start):
+        for pivot in pivots.confirmed_pivots[start:]:
+            event = PivotEvent(key, pivot)
+            self.emitted += 1
+            for callback in self.subscribers:
+                try:
+                    callback(event)
+                except Exception as e:
+                    self.errors += 1
+                    self.last_error = e
+
+    def attach(self, pivots, key=None):
+        """Theo dõi pivots, key (ví dụ (symbol, interval)) được gắn vào mọi sự kiện của nó"""
+        if id(pivots) in self._attached:
+            return
+        original = pivots.process_new_data
+        on_instance = 'process_new_data' in pivots.__dict__
+        emit = self.emit
+
+        def process_new_data(price_data):
+            start = len(pivots.confirmed_pivots)
+            result = original(price_data)
+            if len(pivots.confirmed_pivots) > start:
+                emit(key, pivots, start)
+            return result
+
+        pivots.process_new_data = process_new_data
+        self._attached[id(pivots)] = (pivots, original, on_instance)
+
+    def detach(self, pivots=None):
+        """Gỡ wrapper (trước khi lưu checkpoint, vì wrapper không pickle được)"""
+        targets = [self._attached.pop(id(pivots))] if pivots is not None else list(self._attached.values())
+        if pivots is None:
+            self._attached.clear()
+        for target, original, on_instance in targets:
+            if on_instance:
+                target.process_new_data = original
+            else:
+                target.__dict__.pop('process_new_data', None)
+
+
+def type_filter(*pivot_types):
+    """Chỉ cho qua các loại pivot trong pivot_types, ví dụ type_filter('HH', 'LL')"""
+    allowed = set(pivot_types)
+    return lambda event: event.pivot_type in allowed
+
+
+def key_filter(*keys):
+    allowed = set(keys)
+    return lambda event: event.key in allowed
+
+
+class MemorySink:
+    """Giữ sự kiện trong bộ nhớ, dùng cho test và tích hợp trong cùng process"""
+
+    def __init__(self):
+        self.events = []
+        self.batches = 0
+
+    def write(self, events):
+        self.events.extend(events)
+        self.batches += 1
+
+
+class FileSink:
+    """Ghi thêm mỗi sự kiện một dòng JSON"""
+
+    def __init__(self, path=PIVOT_EVENT_LOG_FILE):
+        self.path = path
+
+    def write(self, events):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for event in events:
+                f.write(json.dumps(event.as_dict(), ensure_ascii=False, default=str) + '\n')
+
+
+class WebhookSink:
+    """POST cả lô sự kiện dạng JSON tới url"""
+
+    def __init__(self, url, timeout=5, session=None):
+        self.url = url
+        self.timeout = timeout
+        self.session = session
+
+    def write(self, events):
+        if self.session is None:
+            import requests
+            self.session = requests.Session()
+        response = self.session.post(
+            self.url, json={'events': [event.as_dict() for event in events]}, timeout=self.timeout
+        )
+        response.raise_for_status()
+
+
+class QueueSink:
+    """Đẩy từng sự kiện vào queue.Queue hoặc asyncio.Queue của bên tiêu thụ"""
+
+    def __init__(self, target):
+        self.target = target
+
+    async def write(self, events):
+        for event in events:
+            if isinstance(self.target, asyncio.Queue):
+                await self.target.put(event)
+            else:
+                # queue.Queue đầy thì báo lỗi thay vì chặn event loop
+                self.target.put_nowait(event)
+
+
+class _SinkWorker:
+    """Hàng đợi và task riêng cho mỗi sink, sink chậm không làm chậm sink khác"""
+
+    def __init__(self, sink, queue_size, batch_size, flush_interval, lag_window):
+        self.sink = sink
+        self.name = type(sink).__name__
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.lags = deque(maxlen=lag_window)
+        self.delivered = 0
+        self.dropped = 0
+        self.errors = 0
+        self.task = None
+
+    def offer(self, event):
+        # Không bao giờ chờ: hàng đợi đầy thì bỏ sự kiện cũ nhất
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+    async def _deliver(self, batch):
+        try:
+            if inspect.iscoroutinefunction(self.sink.write):
+                await self.sink.write(batch)
+            else:
+                # Sink đồng bộ (file, webhook) chạy trên thread để không chặn event loop
+                await asyncio.get_running_loop().run_in_executor(None, self.sink.write, batch)
+        except Exception:
+            self.errors += 1
+            return
+        delivered_at = time.perf_counter()
+        self.lags.extend(delivered_at - event.created for event in batch)
+        self.delivered += len(batch)
+
+    async def run(self):
+        while True:
+            event = await self.queue.get()
+            if event is None:
+                return
+            batch = [event]
+            deadline = time.perf_counter() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    event = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if event is None:
+                    stop = True
+                    break
+                batch.append(event)
+            await self._deliver(batch)
+            if stop:
+                return
+
+    def stats(self):
+        lags = sorted(self.lags)
+        stats = {'sink': self.name, 'delivered': self.delivered, 'dropped': self.dropped, 'errors': self.errors}
+        if lags:
+            stats['lag_p50_ms'] = lags[len(lags) // 2] * 1000
+            stats['lag_p95_ms'] = lags[min(len(lags) - 1, int(0.95 * len(lags)))] * 1000
+            stats['lag_max_ms'] = lags[-1] * 1000
+        return stats
+
+
+class AlertPipeline:
+    """
+    Pipeline asyncio cho sự kiện pivot: lọc -> debounce -> gom lô -> sink
+
+    publish() gọi được từ bất kỳ thread nào (ví dụ worker thread chạy process_new_data) và
+    chỉ chuyển sự kiện sang event loop, không chờ sink. Debounce giữ sự kiện cuối cùng
+    của mỗi (key, loại pivot) trong debounce_s giây rồi mới gửi đi. Độ trễ từ lúc pivot
+    được xác nhận đến lúc sink nhận được đo riêng cho từng sink.
+    """
+
+    def __init__(self, sinks, filters=(), debounce_s=0.0, batch_size=50, flush_interval=0.5,
+                 queue_size=10000, lag_window=10000):
+        self.filters = list(filters)
+        self.debounce_s = debounce_s
+        self.workers = [
+            _SinkWorker(sink, queue_size, batch_size, flush_interval, lag_window) for sink in sinks
+        ]
+        self.published = 0
+        self.filtered = 0
+        self.debounced = 0
+        self._pending = {}
+        self._loop = None
+        self._lock = threading.Lock()
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        for worker in self.workers:
+            worker.task = asyncio.create_task(worker.run())
+        return self
+
+    def publish(self, event):
+        """Nhận sự kiện từ emitter, an toàn khi gọi từ thread khác"""
+        with self._lock:
+            self.published += 1
+        loop = self._loop
+        if loop is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._accept(event)
+        else:
+            loop.call_soon_threadsafe(self._accept, event)
+
+    def _accept(self, event):
+        for accept in self.filters:
+            if not accept(event):
+                self.filtered += 1
+                return
+        if not self.debounce_s:
+            self._dispatch(event)
+            return
+
+        debounce_key = (event.key, event.pivot_type)
+        pending = self._pending.get(debounce_key)
+        if pending is not None:
+            # Sự kiện mới thay sự kiện đang chờ, vẫn gửi vào thời điểm đã hẹn
+            self.debounced += 1
+            self._pending[debounce_key] = (event, pending[1])
+            return
+        handle = self._loop.call_later(self.debounce_s, self._release, debounce_key)
+        self._pending[debounce_key] = (event, handle)
+
+    def _release(self, debounce_key):
+        event, _ = self._pending.pop(debounce_key)
+        self._dispatch(event)
+
+    def _dispatch(self, event):
+        for worker in self.workers:
+            worker.offer(event)
+
+    async def stop(self):
+        """Gửi nốt sự kiện đang debounce và đang chờ trong hàng đợi rồi dừng các sink"""
+        for debounce_key, (event, handle) in list(self._pending.items()):
+            handle.cancel()
+            self._pending.pop(debounce_key)
+            self._dispatch(event)
+        for worker in self.workers:
+            await worker.queue.put(None)
+        await asyncio.gather(*(worker.task for worker in self.workers if worker.task is not None))
+
+    def stats(self):
+        return {
+            'published': self.published,
+            'filtered': self.filtered,
+            'debounced': self.debounced,
+            'sinks': [worker.stats() for worker in self.workers],
+        }
+
+
+def pipeline_from_env():
+    """
+    Pipeline từ biến môi trường, None nếu không cấu hình sink nào
+
+    S1_ALERT_FILE: file JSON lines, S1_ALERT_WEBHOOK: url nhận POST,
+    S1_ALERT_TYPES: ví dụ HH,LL, S1_ALERT_DEBOUNCE: số giây debounce
+    """
+    sinks = []
+    if os.environ.get('S1_ALERT_FILE'):
+        sinks.append(FileSink(os.environ['S1_ALERT_FILE']))
+    if os.environ.get('S1_ALERT_WEBHOOK'):
+        sinks.append(WebhookSink(os.environ['S1_ALERT_WEBHOOK']))
+    if not sinks:
+        return None
+    filters = []
+    types = [t.strip() for t in os.environ.get('S1_ALERT_TYPES', '').split(',') if t.strip()]
+    if types:
+        filters.append(type_filter(*types))
+    return AlertPipeline(sinks, filters, debounce_s=float(os.environ.get('S1_ALERT_DEBOUNCE', 0)))
@@ -0,0 +1,164 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class StreamContext:
+    """Trạng thái của một stream (user, symbol, interval): PivotData riêng và đồng hồ riêng"""
+
+    __slots__ = ('key', 'pivots', 'retention', 'current_time', 'processed', 'confirmed_count')
+
+    def __init__(self, key, pivots, retention=None):
+        self.key = key
+        self.pivots = pivots
+        self.retention = retention
+        self.current_time = None
+        self.processed = 0
+        self.confirmed_count = len(pivots.confirmed_pivots)
+
+    @property
+    def user(self):
+        return self.key[0]
+
+
+class PivotService:
+    """
+    Quản lý nhiều PivotData độc lập theo khóa (user, symbol, interval) thay cho pivot_data toàn cục
+
+    s1 giữ thời gian hiện tại và user trong biến toàn cục của module (set_current_time_and_user),
+    nên mỗi lần dispatch sẽ đặt lại đồng hồ của stream rồi mới gọi process_new_data, cả hai
+    trong cùng một lock. Bản async chạy mọi dispatch trên một worker thread duy nhất, nên thứ tự
+    nến của từng stream được giữ nguyên và event loop không bị chặn.
+
+    Chi phí mỗi stream chỉ là một PivotData và một StreamContext, không có thread hay task riêng.
+    """
+
+    def __init__(self, pivots_factory=None, retention=None):
+        if pivots_factory is None:
+            from s1 import PivotData
+            pivots_factory = PivotData
+        self.pivots_factory = pivots_factory
+        # Mẫu giới hạn, mỗi stream nhận một bản riêng qua for_stream
+        self.retention = retention if retention is not None and retention.enabled else None
+        self._streams = {}
+        self._lock = threading.RLock()
+        self._clock = None
+        self._executor = None
+
+    def __len__(self):
+        return len(self._streams)
+
+    def __contains__(self, key):
+        return tuple(key) in self._streams
+
+    def keys(self):
+        return list(self._streams)
+
+    def get(self, user, symbol, interval, initial_pivots=None, create=True):
+        """StreamContext của (user, symbol, interval), tạo mới (clear_all + seed) nếu chưa có"""
+        key = (user, symbol, interval)
+        context = self._streams.get(key)
+        if context is not None or not create:
+            return context
+        with self._lock:
+            context = self._streams.get(key)
+            if context is None:
+                pivots = self.pivots_factory()
+                pivots.clear_all()
+                if initial_pivots:
+                    from pivot_store import seed_initial_pivots
+                    seed_initial_pivots(pivots, initial_pivots)
+                retention = self.retention.for_stream(key) if self.retention is not None else None
+                context = StreamContext(key, pivots, retention)
+                self._streams[key] = context
+            return context
+
+    def remove(self, user, symbol, interval):
+        with self._lock:
+            return self._streams.pop((user, symbol, interval), None)
+
+    def _apply_clock(self, context):
+        # Chỉ gọi set_current_time_and_user khi đồng hồ khác lần dispatch trước
+        clock = (context.current_time, context.user)
+        if context.current_time is not None and clock != self._clock:
+            from s1 import set_current_time_and_user
+            set_current_time_and_user(*clock)
+            self._clock = clock
+
+    def process_new_data(self, user, symbol, interval, price_data, current_time=None):
+        """
+        Cung cấp một nến cho stream (thread-safe)
+
+        current_time: thời gian hiện tại của stream ('YYYY-MM-DD HH:MM:SS' giờ VN), mặc định lấy
+            từ vn_date/vn_time của nến
+
+        Returns:
+        list: Các pivot mới được xác nhận bởi nến này
+        """
+        context = self.get(user, symbol, interval)
+        with self._lock:
+            if current_time is None and price_data.get('vn_date'):
+                current_time = f"{price_data['vn_date']} {price_data.get('vn_time', price_data['time'])}:00"
+            if current_time is not None:
+                context.current_time = current_time
+            self._apply_clock(context)
+
+            pivots = context.pivots
+            pivots.process_new_data(price_data)
+            context.processed += 1
+
+            confirmed_pivots = pivots.confirmed_pivots
+            new_pivots = confirmed_pivots[context.confirmed_count:]
+            context.confirmed_count = len(confirmed_pivots)
+            if context.retention is not None:
+                context.confirmed_count -= context.retention.apply(pivots)
+            return new_pivots
+
+    async def process_new_data_async(self, user, symbol, interval, price_data, current_time=None):
+        """Như process_new_data nhưng chạy trên worker thread của service, không chặn event loop"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="s1-service")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, self.process_new_data, user, symbol, interval, price_data, current_time
+        )
+
+    async def run_sources(self, sources, on_pivot=None):
+        """
+        Chạy đồng thời nhiều nguồn nến (BinanceKlineSource, ReplaySource...)
+
+        sources: {(user, symbol, interval): source}
+        on_pivot: hàm gọi với (key, pivot) cho mỗi pivot mới
+        """
+        from s1_stream import kline_to_price_data
+
+        async def consume(key, source):
+            async for kline in source:
+                new_pivots = await self.process_new_data_async(*key, kline_to_price_data(kline))
+                if on_pivot is not None:
+                    for pivot in new_pivots:
+                        on_pivot(key, pivot)
+
+        await asyncio.gather(*(consume(tuple(key), source) for key, source in sources.items()))
+
+    def stats(self):
+        """Số nến, số pivot (và thống kê giới hạn nếu có) của từng stream"""
+        rows = []
+        for context in list(self._streams.values()):
+            row = {
+                'user': context.key[0],
+                'symbol': context.key[1],
+                'interval': context.key[2],
+                'processed': context.processed,
+                'pivots': len(context.pivots.confirmed_pivots),
+                'current_time': context.current_time,
+            }
+            if context.retention is not None:
+                row.update(context.retention.stats(context.pivots))
+            rows.append(row)
+        return rows
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
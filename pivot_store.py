@@ -0,0 +1,321 @@
+import math
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from timeutil import VN_OFFSET_MS, DAY_MS, vn_labels
+
+PIVOT_TYPES = ('HH', 'HL', 'LH', 'LL')
+TYPE_CODES = {pivot_type: code for code, pivot_type in enumerate(PIVOT_TYPES)}
+
+# Mỗi pivot: epoch ms (UTC), giá, mã loại -> 17 bytes. Đây là bản sao thêm bên cạnh dict của S1,
+# chỉ giảm bộ nhớ khi list của S1 được cắt (RetentionPolicy, S1_MAX_PIVOTS)
+PIVOT_DTYPE = np.dtype([('timestamp', '<i8'), ('price', '<f8'), ('type', 'u1')])
+
+
+def resolve_pivot_timestamp(pivot_time, candle_ms):
+    """
+    Epoch ms (UTC) của pivot chỉ có giờ 'HH:MM' (giờ VN), xác nhận tại nến candle_ms
+
+    Pivot luôn nằm trước nến xác nhận nên giờ pivot lớn hơn giờ nến nghĩa là ngày hôm trước.
+    """
+    hour, minute = pivot_time.split(':')
+    vn_ms = candle_ms + VN_OFFSET_MS
+    timestamp = vn_ms - vn_ms % DAY_MS + (int(hour) * 60 + int(minute)) * 60000
+    if timestamp > vn_ms:
+        timestamp -= DAY_MS
+    return timestamp - VN_OFFSET_MS
+
+
+def vn_datetime_to_ms(vn_datetime):
+    """'YYYY-MM-DD HH:MM' giờ VN -> epoch ms UTC"""
+    dt = datetime.strptime(vn_datetime, '%Y-%m-%d %H:%M').replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000) - VN_OFFSET_MS
+
+
+def ms_to_vn_datetime(timestamp_ms):
+    """Epoch ms UTC -> 'YYYY-MM-DD HH:MM' giờ VN, chỉ dùng khi cần hiển thị"""
+    return ' '.join(vn_labels(timestamp_ms))
+
+
+class PivotIndex:
+    """
+    Chỉ mục pivot theo thời gian: list timestamp đã sắp xếp và list con cho từng loại,
+    truy vấn khoảng/gần nhất bằng bisect
+
+    Số pivot theo loại và thống kê khoảng cách giữa hai pivot liên tiếp được cập nhật
+    mỗi khi thêm pivot (O(1) khi pivot đến theo thứ tự thời gian, trường hợp thường gặp).
+    """
+
+    __slots__ = ('timestamps', 'prices', 'types', 'by_type', 'counts',
+                 '_gap_count', '_gap_sum', '_gap_sq_sum', '_gap_min', '_gap_max', '_gaps_dirty')
+
+    def __init__(self):
+        self.timestamps = []
+        self.prices = []
+        self.types = []
+        # Loại -> (list timestamp, list giá), cùng thứ tự thời gian
+        self.by_type = {pivot_type: ([], []) for pivot_type in PIVOT_TYPES}
+        self.counts = dict.fromkeys(PIVOT_TYPES, 0)
+        self._reset_gaps()
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def _reset_gaps(self):
+        self._gap_count = 0
+        self._gap_sum = 0
+        self._gap_sq_sum = 0
+        self._gap_min = None
+        self._gap_max = None
+        self._gaps_dirty = False
+
+    def _add_gap(self, gap):
+        self._gap_count += 1
+        self._gap_sum += gap
+        self._gap_sq_sum += gap * gap
+        if self._gap_min is None or gap < self._gap_min:
+            self._gap_min = gap
+        if self._gap_max is None or gap > self._gap_max:
+            self._gap_max = gap
+
+    def add(self, timestamp_ms, price, pivot_type):
+        timestamps = self.timestamps
+        type_timestamps, type_prices = self.by_type[pivot_type]
+        if not timestamps or timestamp_ms >= timestamps[-1]:
+            if timestamps:
+                self._add_gap(timestamp_ms - timestamps[-1])
+            timestamps.append(timestamp_ms)
+            self.prices.append(price)
+            self.types.append(pivot_type)
+        else:
+            # Pivot đến trễ (ví dụ pivot khởi tạo), chèn vào đúng chỗ và tính lại khoảng cách khi cần
+            position = bisect_right(timestamps, timestamp_ms)
+            timestamps.insert(position, timestamp_ms)
+            self.prices.insert(position, price)
+            self.types.insert(position, pivot_type)
+            self._gaps_dirty = True
+
+        if not type_timestamps or timestamp_ms >= type_timestamps[-1]:
+            type_timestamps.append(timestamp_ms)
+            type_prices.append(price)
+        else:
+            position = bisect_right(type_timestamps, timestamp_ms)
+            type_timestamps.insert(position, timestamp_ms)
+            type_prices.insert(position, price)
+        self.counts[pivot_type] += 1
+
+    def clear(self):
+        self.__init__()
+
+    def _pivot(self, position, pivot_type=None):
+        if pivot_type is None:
+            return {'timestamp': self.timestamps[position], 'price': self.prices[position],
+                    'type': self.types[position]}
+        type_timestamps, type_prices = self.by_type[pivot_type]
+        return {'timestamp': type_timestamps[position], 'price': type_prices[position], 'type': pivot_type}
+
+    def _columns(self, pivot_type):
+        return self.timestamps if pivot_type is None else self.by_type[pivot_type][0]
+
+    def in_range(self, start_ms=None, end_ms=None, pivot_type=None):
+        """Các pivot có timestamp trong [start_ms, end_ms], lọc theo loại nếu có"""
+        timestamps = self._columns(pivot_type)
+        low = 0 if start_ms is None else bisect_left(timestamps, start_ms)
+        high = len(timestamps) if end_ms is None else bisect_right(timestamps, end_ms)
+        return [self._pivot(position, pivot_type) for position in range(low, high)]
+
+    def count(self, pivot_type=None, start_ms=None, end_ms=None):
+        """Số pivot trong [start_ms, end_ms] mà không tạo list kết quả"""
+        timestamps = self._columns(pivot_type)
+        low = 0 if start_ms is None else bisect_left(timestamps, start_ms)
+        high = len(timestamps) if end_ms is None else bisect_right(timestamps, end_ms)
+        return max(high - low, 0)
+
+    def last_before(self, timestamp_ms, pivot_type=None, inclusive=True):
+        """Pivot gần nhất trước (hoặc tại) timestamp_ms, ví dụ last_before(t, 'HL')"""
+        timestamps = self._columns(pivot_type)
+        position = (bisect_right if inclusive else bisect_left)(timestamps, timestamp_ms) - 1
+        return self._pivot(position, pivot_type) if position >= 0 else None
+
+    def first_after(self, timestamp_ms, pivot_type=None, inclusive=True):
+        """Pivot gần nhất sau (hoặc tại) timestamp_ms"""
+        timestamps = self._columns(pivot_type)
+        position = (bisect_left if inclusive else bisect_right)(timestamps, timestamp_ms)
+        return self._pivot(position, pivot_type) if position < len(timestamps) else None
+
+    def nearest(self, timestamp_ms, pivot_type=None):
+        """Pivot có timestamp gần timestamp_ms nhất (về cả hai phía)"""
+        before = self.last_before(timestamp_ms, pivot_type)
+        after = self.first_after(timestamp_ms, pivot_type)
+        if before is None or after is None:
+            return before or after
+        if timestamp_ms - before['timestamp'] <= after['timestamp'] - timestamp_ms:
+            return before
+        return after
+
+    def gap_stats(self):
+        """
+        Thống kê khoảng cách (phút) giữa hai pivot liên tiếp theo thời gian đầy đủ,
+        không bị sai khi qua nửa đêm như khi so sánh chuỗi 'HH:MM'
+        """
+        if self._gaps_dirty:
+            self._reset_gaps()
+            for previous, current in zip(self.timestamps, self.timestamps[1:]):
+                self._add_gap(current - previous)
+        if not self._gap_count:
+            return {'gaps': 0, 'avg_gap_minutes': None, 'min_gap_minutes': None,
+                    'max_gap_minutes': None, 'std_gap_minutes': None}
+
+        mean = self._gap_sum / self._gap_count
+        std = None
+        if self._gap_count > 1:
+            std = math.sqrt(max(self._gap_sq_sum / self._gap_count - mean * mean, 0)) / 60000
+        return {
+            'gaps': self._gap_count,
+            'avg_gap_minutes': mean / 60000,
+            'min_gap_minutes': self._gap_min / 60000,
+            'max_gap_minutes': self._gap_max / 60000,
+            'std_gap_minutes': std,
+        }
+
+
+class PivotStore:
+    """
+    Lưu pivot dạng cột trong một mảng NumPy structured (timestamp int64, price float64, type uint8)
+
+    Mảng tăng gấp đôi khi đầy nên append có chi phí O(1) trung bình. index là PivotIndex
+    được cập nhật cùng lúc để truy vấn theo thời gian/loại.
+    """
+
+    __slots__ = ('_data', '_size', 'index')
+
+    def __init__(self, capacity=256):
+        self._data = np.empty(capacity, dtype=PIVOT_DTYPE)
+        self._size = 0
+        self.index = PivotIndex()
+
+    def __getstate__(self):
+        # Chỉ lưu phần dữ liệu, index được dựng lại khi khôi phục (checkpoint nhỏ hơn, tương thích bản cũ)
+        return {'_data': self._data[:self._size].copy(), '_size': self._size}
+
+    def __setstate__(self, state):
+        if isinstance(state, tuple):
+            # Checkpoint cũ lưu theo __slots__ mặc định: (None, {slot: giá trị})
+            state = state[1]
+        self._data = state['_data']
+        self._size = state['_size']
+        self.index = PivotIndex()
+        for timestamp, price, code in zip(self.timestamps.tolist(), self.prices.tolist(), self.types.tolist()):
+            self.index.add(timestamp, price, PIVOT_TYPES[code])
+
+    def __len__(self):
+        return self._size
+
+    def append(self, timestamp_ms, price, pivot_type):
+        if self._size == len(self._data):
+            grown = np.empty(max(1, len(self._data) * 2), dtype=PIVOT_DTYPE)
+            grown[:self._size] = self._data[:self._size]
+            self._data = grown
+        self._data[self._size] = (timestamp_ms, price, TYPE_CODES[pivot_type])
+        self._size += 1
+        self.index.add(int(timestamp_ms), float(price), pivot_type)
+
+    def add_pivot(self, pivot, candle_ms=None):
+        """Thêm một pivot dạng dict của S1, lấy ngày từ vn_datetime/vn_date hoặc từ nến xác nhận"""
+        if pivot.get('vn_datetime'):
+            timestamp = vn_datetime_to_ms(pivot['vn_datetime'])
+        elif pivot.get('vn_date'):
+            timestamp = vn_datetime_to_ms(f"{pivot['vn_date']} {pivot.get('vn_time', pivot.get('time'))}")
+        elif candle_ms is not None:
+            timestamp = resolve_pivot_timestamp(pivot['time'], candle_ms)
+        else:
+            raise ValueError(f"Không xác định được ngày của pivot {pivot}")
+        self.append(timestamp, pivot['price'], pivot['type'])
+
+    def clear(self):
+        self._size = 0
+        self.index.clear()
+
+    @property
+    def records(self):
+        return self._data[:self._size]
+
+    @property
+    def timestamps(self):
+        return self._data['timestamp'][:self._size]
+
+    @property
+    def prices(self):
+        return self._data['price'][:self._size]
+
+    @property
+    def types(self):
+        return self._data['type'][:self._size]
+
+    def as_dicts(self):
+        """View dạng dict giống get_all_pivots, chuỗi thời gian chỉ được format tại đây"""
+        return [
+            {
+                'type': PIVOT_TYPES[code],
+                'price': float(price),
+                'timestamp': int(timestamp),
+                'vn_datetime': ms_to_vn_datetime(int(timestamp)),
+            }
+            for timestamp, price, code in zip(self.timestamps.tolist(), self.prices.tolist(), self.types.tolist())
+        ]
+
+
+def record_new_pivots(pivots, store, start, candle_ms):
+    """
+    Chép các pivot mới (từ vị trí start) của PivotData vào PivotStore
+
+    Returns:
+    int: Số pivot hiện có, dùng làm start cho lần gọi sau
+    """
+    confirmed_pivots = pivots.confirmed_pivots
+    for pivot in confirmed_pivots[start:]:
+        store.add_pivot(pivot, candle_ms)
+    return len(confirmed_pivots)
+
+
+def silent_log(message, level="INFO"):
+    """log_message không ghi gì, dùng cho worker/stream không cần log khởi tạo"""
+
+
+def seed_initial_pivots(pivots, initial_pivots, log_message=silent_log):
+    """Thêm pivot khởi tạo (giờ VN) vào một PivotData đã clear_all"""
+    # Thêm phương thức add_initial_trading_view_pivots vào PivotData để xử lý đúng múi giờ
+    if hasattr(pivots, 'add_initial_trading_view_pivots'):
+        # Sử dụng phương thức mới nếu có
+        pivots.add_initial_trading_view_pivots(initial_pivots)
+        
+        # Log các pivot đã thêm
+        for pivot in initial_pivots:
+            vn_datetime = f"{pivot['vn_date']} {pivot['vn_time']}"
+            log_message(f"- {pivot['type']} tại ${pivot['price']:,.2f} (VN: {vn_datetime})", "INFO")
+    else:
+        # Fallback nếu không có phương thức mới
+        log_message("⚠️ WARNING: Không tìm thấy phương thức add_initial_trading_view_pivots", "WARNING")
+        log_message("⚠️ Thêm pivot theo cách thủ công và chuyển đổi múi giờ", "WARNING")
+        
+        pivots.confirmed_pivots.clear()  # Xóa toàn bộ pivot hiện có
+        
+        for pivot in initial_pivots:
+            # Chuyển đổi thời gian Việt Nam sang UTC
+            vn_datetime = f"{pivot['vn_date']} {pivot['vn_time']}"
+            vn_dt = datetime.strptime(vn_datetime, '%Y-%m-%d %H:%M')
+            utc_dt = vn_dt - timedelta(hours=7)
+            
+            # Tạo pivot với thời gian UTC
+            utc_pivot = pivot.copy()
+            utc_pivot['time'] = utc_dt.strftime('%H:%M')  # Thời gian UTC
+            utc_pivot['utc_date'] = utc_dt.strftime('%Y-%m-%d')
+            utc_pivot['utc_datetime'] = utc_dt.strftime('%Y-%m-%d %H:%M')
+            utc_pivot['vn_datetime'] = vn_datetime
+            utc_pivot['skip_spacing_check'] = True
+            
+            # Thêm pivot vào S1
+            pivots.confirmed_pivots.append(utc_pivot)
+            
+            # Log pivot đã thêm
+            log_message(f"- {pivot['type']} tại ${pivot['price']:,.2f} (VN: {vn_datetime}, UTC: {utc_pivot['utc_datetime']})", "INFO")
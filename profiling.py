@@ -0,0 +1,236 @@
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+
+# Cận trên (µs) của các bucket histogram độ trễ mỗi nến, bucket cuối là "lớn hơn"
+LATENCY_BUCKETS_US = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 50000, 100000)
+PROFILE_MODES = ('off', 'timers', 'cprofile', 'sample')
+
+
+class HotPathProfiler:
+    """
+    Đo thời gian các hot path của S1: process_new_data (kèm histogram độ trễ mỗi nến),
+    s1.save_log và các method PivotData khai báo thêm
+
+    Chỉ bật khi cần: lúc tắt không có wrapper nào được gắn nên không tốn chi phí.
+    Mode 'cprofile' chạy thêm cProfile, 'sample' lấy mẫu stack của thread đang feed nến.
+    """
+
+    def __init__(self, mode='off', methods=(), sample_interval=0.005, top=15):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Profile mode {mode} không hợp lệ, chọn một trong {PROFILE_MODES}")
+        self.mode = mode
+        self.methods = tuple(methods)
+        self.sample_interval = sample_interval
+        self.top = top
+        self.calls = {}
+        self.totals = {}
+        self.maxima = {}
+        self.histogram = [0] * (len(LATENCY_BUCKETS_US) + 1)
+        self._installed = {}
+        self._original_log = None
+        self._cprofile = None
+        self._samples = Counter()
+        self._sample_count = 0
+
+    @classmethod
+    def from_env(cls):
+        """
+        S1_PROFILE: off (mặc định), 1/timers, cprofile hoặc sample
+        S1_PROFILE_METHODS: tên các method khác của PivotData cần đo, cách nhau bởi dấu phẩy
+        """
+        mode = os.environ.get('S1_PROFILE', 'off').strip().lower() or 'off'
+        if mode in ('0', 'false'):
+            mode = 'off'
+        elif mode in ('1', 'true'):
+            mode = 'timers'
+        methods = [name.strip() for name in os.environ.get('S1_PROFILE_METHODS', '').split(',') if name.strip()]
+        return cls(mode, methods)
+
+    @property
+    def enabled(self):
+        return self.mode != 'off'
+
+    def _wrap(self, stage, func, histogram=False):
+        calls = self.calls
+        totals = self.totals
+        maxima = self.maxima
+        buckets = self.histogram
+        perf_counter = time.perf_counter
+        calls.setdefault(stage, 0)
+        totals.setdefault(stage, 0.0)
+        maxima.setdefault(stage, 0.0)
+
+        def wrapper(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = perf_counter() - start
+                calls[stage] += 1
+                totals[stage] += elapsed
+                if elapsed > maxima[stage]:
+                    maxima[stage] = elapsed
+                if histogram:
+                    buckets[bisect_left(LATENCY_BUCKETS_US, elapsed * 1e6)] += 1
+
+        wrapper.__wrapped__ = func
+        return wrapper
+
+    def install(self, pivots):
+        """Gắn wrapper lên instance pivots (không sửa class) và lên s1.save_log"""
+        if not self.enabled or self._installed:
+            return
+        import s1
+
+        for name in ('process_new_data',) + self.methods:
+            if hasattr(pivots, name):
+                original = getattr(pivots, name)
+                # Nhớ method có sẵn trên instance hay không để gỡ cho đúng
+                self._installed[name] = (original, name in pivots.__dict__)
+                setattr(pivots, name, self._wrap(name, original, name == 'process_new_data'))
+        self._pivots = pivots
+        self._original_log = s1.save_log
+        s1.save_log = self._wrap('save_log', s1.save_log)
+
+    def uninstall(self):
+        """Gỡ toàn bộ wrapper, số liệu đã đo được giữ lại"""
+        if not self._installed:
+            return
+        import s1
+
+        for name, (original, on_instance) in self._installed.items():
+            if on_instance:
+                setattr(self._pivots, name, original)
+            else:
+                self._pivots.__dict__.pop(name, None)
+        self._installed = {}
+        if self._original_log is not None:
+            s1.save_log = self._original_log
+            self._original_log = None
+
+    @contextmanager
+    def detached(self):
+        """Tạm gỡ wrapper, ví dụ khi lưu/khôi phục checkpoint (wrapper không pickle được)"""
+        pivots = getattr(self, '_pivots', None) if self._installed else None
+        self.uninstall()
+        try:
+            yield
+        finally:
+            if pivots is not None:
+                self.install(pivots)
+
+    @contextmanager
+    def profiling(self):
+        """Bật cProfile hoặc sampler trong khối lệnh, số liệu cộng dồn qua nhiều lần gọi"""
+        if self.mode == 'cprofile':
+            if self._cprofile is None:
+                import cProfile
+                self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+            try:
+                yield
+            finally:
+                self._cprofile.disable()
+        elif self.mode == 'sample':
+            stop = threading.Event()
+            sampler = threading.Thread(
+                target=self._sample_loop, args=(threading.get_ident(), stop), daemon=True
+            )
+            sampler.start()
+            try:
+                yield
+            finally:
+                stop.set()
+                sampler.join()
+        else:
+            yield
+
+    def _sample_loop(self, thread_id, stop):
+        while not stop.wait(self.sample_interval):
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                continue
+            self._sample_count += 1
+            # Đếm inclusive: mỗi hàm trên stack được tính một lần cho mẫu này
+            seen = set()
+            while frame is not None:
+                code = frame.f_code
+                key = f"{os.path.basename(code.co_filename)}:{code.co_firstlineno}({code.co_name})"
+                if key not in seen:
+                    seen.add(key)
+                    self._samples[key] += 1
+                frame = frame.f_back
+
+    def latency_percentile(self, q):
+        """Phân vị độ trễ process_new_data (µs), ước lượng bằng cận trên của bucket"""
+        total = sum(self.histogram)
+        if not total:
+            return None
+        threshold = q * total
+        running = 0
+        for i, count in enumerate(self.histogram):
+            running += count
+            if running >= threshold:
+                if i < len(LATENCY_BUCKETS_US):
+                    return LATENCY_BUCKETS_US[i]
+                return self.maxima.get('process_new_data', 0.0) * 1e6
+        return None
+
+    def profile_top(self):
+        """Các hàm tốn thời gian nhất theo cProfile hoặc sampler"""
+        if self._cprofile is not None:
+            import io
+            import pstats
+
+            stream = io.StringIO()
+            pstats.Stats(self._cprofile, stream=stream).sort_stats('cumulative').print_stats(self.top)
+            return [line for line in stream.getvalue().splitlines() if line.strip()]
+        if self._sample_count:
+            return [
+                f"{count / self._sample_count:6.1%}  {key}"
+                for key, count in self._samples.most_common(self.top)
+            ]
+        return []
+
+    def snapshot(self):
+        """Toàn bộ số liệu hiện tại dạng dict"""
+        stages = {
+            stage: {
+                'calls': calls,
+                'total_s': self.totals[stage],
+                'avg_us': self.totals[stage] / calls * 1e6 if calls else None,
+                'max_us': self.maxima[stage] * 1e6,
+            }
+            for stage, calls in self.calls.items()
+        }
+        labels = [f"<={edge}us" for edge in LATENCY_BUCKETS_US] + [f">{LATENCY_BUCKETS_US[-1]}us"]
+        return {
+            'mode': self.mode,
+            'stages': stages,
+            'latency_histogram': dict(zip(labels, self.histogram)),
+            'latency_p50_us': self.latency_percentile(0.50),
+            'latency_p95_us': self.latency_percentile(0.95),
+            'latency_p99_us': self.latency_percentile(0.99),
+            'profile_top': self.profile_top(),
+        }
+
+    def summary(self):
+        """Vài chỉ số phẳng để đưa vào báo cáo tổng hợp (CSV)"""
+        summary = {f"{stage}_s": total for stage, total in self.totals.items()}
+        summary['latency_p95_us'] = self.latency_percentile(0.95)
+        return summary
+
+    def reset(self):
+        for stage in self.calls:
+            self.calls[stage] = 0
+            self.totals[stage] = 0.0
+            self.maxima[stage] = 0.0
+        self.histogram[:] = [0] * len(self.histogram)
+        self._cprofile = None
+        self._samples.clear()
+        self._sample_count = 0
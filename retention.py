@@ -0,0 +1,151 @@
+import json
+import os
+from collections import deque
+
+
+def _env_int(name):
+    value = os.environ.get(name, '').strip()
+    return int(value) if value else None
+
+
+class RetentionPolicy:
+    """
+    Giới hạn bộ nhớ của một PivotData chạy lâu dài
+
+    - Lịch sử giá (các list/deque nến bên trong PivotData) chỉ giữ max_candles nến gần nhất
+    - confirmed_pivots chỉ giữ max_pivots pivot gần nhất, pivot cũ được ghi thêm
+      vào spill_file (JSON lines) nếu có
+
+    Các list được cắt tại chỗ (không đổi kiểu) khi vượt giới hạn thêm một khoảng slack,
+    nên chi phí cắt được chia đều cho nhiều nến và mỗi nến vẫn O(1).
+    """
+
+    def __init__(self, max_candles=None, max_pivots=None, spill_file=None,
+                 price_attrs=None, pivot_attr='confirmed_pivots', slack=0.1, key=None):
+        self.max_candles = max_candles
+        self.max_pivots = max_pivots
+        self.spill_file = spill_file
+        # Khóa stream (user, symbol, interval), nếu có được ghi vào mỗi pivot bị cắt
+        self.key = tuple(key) if key is not None else None
+        # None: tự tìm các thuộc tính chứa nến ở lần apply đầu tiên
+        self.price_attrs = tuple(price_attrs) if price_attrs else None
+        self.pivot_attr = pivot_attr
+        self.slack = slack
+        self.trimmed_candles = 0
+        self.spilled_pivots = 0
+
+    @classmethod
+    def from_env(cls):
+        """
+        S1_MAX_CANDLES, S1_MAX_PIVOTS: giới hạn số nến/pivot giữ trong bộ nhớ (trống là không giới hạn)
+        S1_PIVOT_SPILL: file JSON lines nhận các pivot bị cắt
+        S1_PRICE_ATTRS: tên các thuộc tính lịch sử giá của PivotData, cách nhau bởi dấu phẩy
+        """
+        price_attrs = [name.strip() for name in os.environ.get('S1_PRICE_ATTRS', '').split(',') if name.strip()]
+        return cls(
+            max_candles=_env_int('S1_MAX_CANDLES'),
+            max_pivots=_env_int('S1_MAX_PIVOTS'),
+            spill_file=os.environ.get('S1_PIVOT_SPILL') or None,
+            price_attrs=price_attrs or None
+        )
+
+    def for_stream(self, key):
+        """
+        Bản sao cùng giới hạn cho một stream: bộ đếm và price_attrs tự tìm riêng,
+        spill_file riêng theo khóa (ví dụ pivot_spill.jsonl -> pivot_spill.user_BTCUSDT_30m.jsonl)
+        """
+        spill_file = None
+        if self.spill_file:
+            root, ext = os.path.splitext(self.spill_file)
+            spill_file = f"{root}.{'_'.join(str(part) for part in key)}{ext}"
+        return RetentionPolicy(
+            max_candles=self.max_candles,
+            max_pivots=self.max_pivots,
+            spill_file=spill_file,
+            price_attrs=self.price_attrs,
+            pivot_attr=self.pivot_attr,
+            slack=self.slack,
+            key=key
+        )
+
+    @property
+    def enabled(self):
+        return self.max_candles is not None or self.max_pivots is not None
+
+    def detect_price_attrs(self, pivots):
+        """Các list/deque của pivots có phần tử là dict nến (có 'high' và 'low')"""
+        names = []
+        for name, value in vars(pivots).items():
+            if name == self.pivot_attr or not isinstance(value, (list, deque)) or not value:
+                continue
+            last = value[-1]
+            if isinstance(last, dict) and 'high' in last and 'low' in last:
+                names.append(name)
+        return tuple(names)
+
+    def _trim(self, values, limit):
+        """Cắt phần đầu của values về còn limit phần tử, trả về các phần tử bị cắt"""
+        excess = len(values) - limit
+        if excess <= int(limit * self.slack):
+            return []
+        if isinstance(values, deque):
+            return [values.popleft() for _ in range(excess)]
+        removed = values[:excess]
+        del values[:excess]
+        return removed
+
+    def spill(self, removed_pivots):
+        if not self.spill_file or not removed_pivots:
+            return
+        directory = os.path.dirname(self.spill_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.spill_file, 'a', encoding='utf-8') as f:
+            for pivot in removed_pivots:
+                record = dict(pivot, stream=list(self.key)) if self.key is not None else pivot
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+
+    def apply(self, pivots):
+        """
+        Áp dụng giới hạn lên pivots, gọi sau mỗi nến (sau khi đã đọc các pivot mới)
+
+        Returns:
+        int: Số pivot bị cắt khỏi đầu confirmed_pivots, để bên gọi trừ vào chỉ số đang theo dõi
+        """
+        if self.max_candles is not None:
+            if self.price_attrs is None:
+                detected = self.detect_price_attrs(pivots)
+                if detected:
+                    self.price_attrs = detected
+            for name in self.price_attrs or ():
+                values = getattr(pivots, name, None)
+                if values is not None:
+                    self.trimmed_candles += len(self._trim(values, self.max_candles))
+
+        if self.max_pivots is None:
+            return 0
+        removed = self._trim(getattr(pivots, self.pivot_attr), self.max_pivots)
+        if removed:
+            self.spill(removed)
+            self.spilled_pivots += len(removed)
+        return len(removed)
+
+    def load_spilled(self):
+        """Đọc lại các pivot đã ghi ra spill_file"""
+        if not self.spill_file or not os.path.exists(self.spill_file):
+            return []
+        with open(self.spill_file, encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def stats(self, pivots):
+        """Kích thước hiện tại của các vùng nhớ được giới hạn"""
+        stats = {
+            'retained_pivots': len(getattr(pivots, self.pivot_attr)),
+            'spilled_pivots': self.spilled_pivots,
+            'trimmed_candles': self.trimmed_candles,
+        }
+        for name in self.price_attrs or ():
+            values = getattr(pivots, name, None)
+            if values is not None:
+                stats[f"retained_{name}"] = len(values)
+        return stats
@@ -0,0 +1,245 @@
+import asyncio
+import os
+import sys
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from log_sink import get_sink, route_s1_logs
+from kline_cache import KlineCache, DEFAULT_CACHE_DIR, to_ms
+from retention import RetentionPolicy
+from pivot_events import PivotEmitter, pipeline_from_env
+from timeutil import VN_OFFSET_MS, make_price_data, split_ms
+
+STREAM_LOG_FILE = "debug_stream.log"
+
+
+def kline_to_price_data(kline):
+    """Chuyển một kline (định dạng get_historical_klines) sang price_data cho process_new_data"""
+    day, minute = split_ms(int(kline[0]), VN_OFFSET_MS)
+    return make_price_data(day, minute, float(kline[4]), float(kline[2]), float(kline[3]))
+
+
+class BinanceKlineSource:
+    """Nguồn nến đóng từ websocket kline của Binance"""
+
+    def __init__(self, symbol, interval):
+        self.symbol = symbol
+        self.interval = interval
+
+    async def __aiter__(self):
+        from binance import AsyncClient, BinanceSocketManager
+
+        client = await AsyncClient.create()
+        try:
+            manager = BinanceSocketManager(client)
+            async with manager.kline_socket(symbol=self.symbol, interval=self.interval) as stream:
+                while True:
+                    msg = await stream.recv()
+                    k = msg.get('k') if msg else None
+                    # Chỉ lấy nến đã đóng
+                    if not k or not k['x']:
+                        continue
+                    yield [k['t'], k['o'], k['h'], k['l'], k['c'], k['v'],
+                           k['T'], k['q'], k['n'], k['V'], k['Q'], k['B']]
+        finally:
+            await client.close_connection()
+
+
+class ReplaySource:
+    """
+    Phát lại kline từ bộ nhớ hoặc KlineCache, dùng để test không cần mạng
+
+    delay: số giây chờ giữa hai nến, 0 để phát nhanh nhất có thể
+    """
+
+    def __init__(self, klines, delay=0.0):
+        self.klines = klines
+        self.delay = delay
+
+    @classmethod
+    def from_cache(cls, symbol, interval, start_time, end_time, cache_dir=DEFAULT_CACHE_DIR, delay=0.0):
+        klines = KlineCache(cache_dir).get_klines(symbol, interval, to_ms(start_time), to_ms(end_time))
+        return cls(klines, delay)
+
+    async def __aiter__(self):
+        for kline in self.klines:
+            yield kline
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            else:
+                # Nhường event loop để consumer chạy song song
+                await asyncio.sleep(0)
+
+
+class S1StreamDriver:
+    """
+    Đẩy nến đóng từ một source vào pivot_data.process_new_data
+
+    Source và xử lý pivot nối với nhau qua asyncio.Queue có giới hạn: khi S1 xử lý
+    chậm thì put() chờ, source ngừng đọc thay vì bỏ nến. process_new_data chạy trên
+    một worker thread duy nhất để giữ thứ tự nến mà không chặn event loop.
+
+    retention: RetentionPolicy giới hạn lịch sử giá/pivot khi chạy lâu dài, mặc định đọc từ biến môi trường
+    pipeline: AlertPipeline nhận sự kiện ngay khi pivot được xác nhận, key gắn vào mỗi sự kiện
+    """
+
+    def __init__(self, source, pivots=None, queue_size=1000, log_file=STREAM_LOG_FILE, latency_window=100000,
+                 retention=None, pipeline=None, key=None):
+        self.source = source
+        if pivots is None:
+            from s1 import pivot_data
+            pivots = pivot_data
+        self.pivot_data = pivots
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.log_sink = get_sink(log_file)
+        self.latencies = deque(maxlen=latency_window)
+        self.processed = 0
+        self.max_queue_depth = 0
+        self.backpressure_stalls = 0
+        self.source_wait = 0.0
+        self.retention = retention if retention is not None else RetentionPolicy.from_env()
+        self.pipeline = pipeline
+        self.key = key
+        self.emitter = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="s1-stream")
+
+    def log_message(self, message, level="INFO"):
+        self.log_sink.log(message, level)
+
+    async def _produce(self):
+        async for kline in self.source:
+            received = time.perf_counter()
+            if self.queue.full():
+                if not self.backpressure_stalls:
+                    self.log_message(f"⚠️ Hàng đợi đầy ({self.queue.maxsize}), tạm dừng đọc source", "WARNING")
+                self.backpressure_stalls += 1
+            await self.queue.put((received, kline))
+            self.source_wait += time.perf_counter() - received
+            self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+        await self.queue.put(None)
+
+    def _process(self, kline):
+        price_data = kline_to_price_data(kline)
+        before = len(self.pivot_data.confirmed_pivots)
+        self.pivot_data.process_new_data(price_data)
+        confirmed = self.pivot_data.confirmed_pivots
+        for pivot in confirmed[before:]:
+            self.log_message(f"📍 {pivot['type']} tại ${pivot['price']:,.2f} ({pivot.get('time', '')})", "SUCCESS")
+        if self.retention.enabled:
+            self.retention.apply(self.pivot_data)
+
+    async def _consume(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self.queue.get()
+            if item is None:
+                break
+            received, kline = item
+            await loop.run_in_executor(self._executor, self._process, kline)
+            # Độ trễ tính từ lúc nhận nến tới khi S1 xử lý xong
+            self.latencies.append(time.perf_counter() - received)
+            self.processed += 1
+
+    async def run(self):
+        """Chạy tới khi source kết thúc (replay) hoặc bị hủy (live)"""
+        self.log_message("\n=== Bắt đầu stream S1 ===", "INFO")
+        if self.pipeline is not None:
+            await self.pipeline.start()
+            self.emitter = PivotEmitter()
+            self.emitter.subscribe(self.pipeline.publish)
+            self.emitter.attach(self.pivot_data, self.key)
+        producer = asyncio.create_task(self._produce())
+        try:
+            await self._consume()
+            await producer
+        except asyncio.CancelledError:
+            producer.cancel()
+            raise
+        except Exception as e:
+            producer.cancel()
+            self.log_message(f"❌ Lỗi stream: {str(e)}", "ERROR")
+            self.log_message(traceback.format_exc(), "ERROR")
+            raise
+        finally:
+            self._executor.shutdown(wait=True)
+            if self.pipeline is not None:
+                self.emitter.detach()
+                await self.pipeline.stop()
+            self.log_stats()
+        return self.stats()
+
+    def stats(self):
+        """Thống kê độ trễ xử lý mỗi nến (ms)"""
+        latencies = sorted(self.latencies)
+        if not latencies:
+            return {'processed': self.processed}
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+
+        stats = {
+            'processed': self.processed,
+            'latency_p50_ms': percentile(0.50),
+            'latency_p95_ms': percentile(0.95),
+            'latency_p99_ms': percentile(0.99),
+            'latency_max_ms': latencies[-1] * 1000,
+            'max_queue_depth': self.max_queue_depth,
+            'backpressure_stalls': self.backpressure_stalls,
+            'source_wait_s': self.source_wait,
+        }
+        if self.retention.enabled:
+            stats.update(self.retention.stats(self.pivot_data))
+        if self.pipeline is not None:
+            alerts = self.pipeline.stats()
+            stats['alerts_published'] = alerts['published']
+            stats['alerts_subscriber_errors'] = self.emitter.errors if self.emitter is not None else 0
+            for sink in alerts['sinks']:
+                for name, value in sink.items():
+                    if name != 'sink':
+                        stats[f"alerts_{sink['sink']}_{name}"] = value
+        return stats
+
+    def log_stats(self):
+        self.log_message("\n=== Thống kê stream ===", "SUMMARY")
+        for key, value in self.stats().items():
+            if isinstance(value, float):
+                self.log_message(f"{key}: {value:.3f}", "SUMMARY")
+            else:
+                self.log_message(f"{key}: {value}", "SUMMARY")
+
+
+def main():
+    """
+    Live:    python s1_stream.py BTCUSDT 30m
+    Replay:  S1_OFFLINE=1 python s1_stream.py BTCUSDT 30m "2025-03-14 17:00:00" "2025-03-16 12:00:00"
+    """
+    if len(sys.argv) < 3:
+        print(main.__doc__)
+        return None
+
+    symbol, interval = sys.argv[1], sys.argv[2]
+    route_s1_logs(get_sink(STREAM_LOG_FILE))
+    if os.environ.get('S1_OFFLINE', '0') == '1':
+        start_time = datetime.strptime(sys.argv[3], '%Y-%m-%d %H:%M:%S')
+        end_time = datetime.strptime(sys.argv[4], '%Y-%m-%d %H:%M:%S')
+        source = ReplaySource.from_cache(
+            symbol, interval, start_time, end_time,
+            cache_dir=os.environ.get('KLINE_CACHE_DIR', DEFAULT_CACHE_DIR)
+        )
+    else:
+        source = BinanceKlineSource(symbol, interval)
+
+    try:
+        # S1_ALERT_FILE / S1_ALERT_WEBHOOK: gửi cảnh báo ngay khi có pivot mới
+        driver = S1StreamDriver(source, pipeline=pipeline_from_env(), key=(symbol, interval))
+        return asyncio.run(driver.run())
+    except KeyboardInterrupt:
+        print("Đã dừng stream")
+        return None
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+
+# Các cột nến worker cần (xem S1HistoricalTester.prepare_candles), 34 bytes mỗi nến
+CANDLE_DTYPE = np.dtype([
+    ('timestamp', '<i8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('price', '<f8'),
+    ('vn_day', '<i4'),
+    ('vn_minute', '<i2'),
+])
+
+
+def _attach_segment(name):
+    """Mở segment có sẵn mà không để resource_tracker của worker xóa nó khi worker thoát"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 chưa có track=False, attach cũng đăng ký segment với resource_tracker.
+        # Với fork worker dùng chung tracker của process chính, gỡ đăng ký sẽ gỡ luôn của process
+        # chính nên giữ nguyên. Với spawn/forkserver worker có tracker riêng, phải gỡ để tracker
+        # đó không xóa segment khi worker thoát.
+        segment = shared_memory.SharedMemory(name=name)
+        if multiprocessing.get_start_method(allow_none=True) in ('spawn', 'forkserver'):
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(segment._name, 'shared_memory')
+        return segment
+
+
+class SharedCandles:
+    """
+    Bộ nến dùng chung giữa các process qua multiprocessing.shared_memory
+
+    Process chính gọi publish(df) một lần. Worker nhận spec (tên segment và số nến, chỉ vài
+    byte khi pickle) rồi attach(spec) để có các view NumPy trỏ thẳng vào vùng nhớ chung,
+    không copy, nên bộ nhớ không tăng theo số worker.
+    """
+
+    def __init__(self, segment, length, owner):
+        self.segment = segment
+        self.length = length
+        self.owner = owner
+        self.records = np.ndarray((length,), dtype=CANDLE_DTYPE, buffer=segment.buf)
+
+    @classmethod
+    def publish(cls, df):
+        """Chép các cột nến của df vào một segment shared memory mới"""
+        length = len(df)
+        segment = shared_memory.SharedMemory(create=True, size=max(length, 1) * CANDLE_DTYPE.itemsize)
+        shared = cls(segment, length, owner=True)
+        for name in CANDLE_DTYPE.names:
+            shared.records[name] = df[name].to_numpy()
+        return shared
+
+    @classmethod
+    def attach(cls, spec):
+        name, length = spec
+        return cls(_attach_segment(name), length, owner=False)
+
+    @property
+    def spec(self):
+        """Thông tin gửi cho worker để attach"""
+        return (self.segment.name, self.length)
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, column):
+        return self.records[column]
+
+    def close(self):
+        """Đóng view, process tạo segment thì xóa luôn segment"""
+        # Bỏ tham chiếu tới buffer trước khi đóng, nếu không SharedMemory.close() báo lỗi
+        self.records = None
+        self.segment.close()
+        if self.owner:
+            self.segment.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
@@ -0,0 +1,115 @@
+import unittest
+
+import numpy as np
+
+from data_quality import CLOSE, CLOSE_TIME, HIGH, LOW, DataQualityPolicy, repair_klines
+from timeutil import DAY_MS, INTERVAL_MS
+
+MINUTE = INTERVAL_MS['1m']
+
+
+def make_klines(count, interval_ms=MINUTE, start=0):
+    """Kline hợp lệ liên tục: open 100, high 101, low 99, close tăng dần"""
+    rows = []
+    for i in range(count):
+        open_time = start + i * interval_ms
+        rows.append([open_time, 100, 101, 99, 100 + i, 10, open_time + interval_ms - 1, 15, 3, 5, 7, 0])
+    return np.array(rows, dtype=np.float64)
+
+
+class RepairKlinesTest(unittest.TestCase):
+    def test_clean_data_passes_through(self):
+        data, report = repair_klines(make_klines(10), '1m')
+        self.assertTrue(report.ok)
+        self.assertEqual(len(data), 10)
+
+    def test_invalid_duplicate_does_not_drop_valid_candle(self):
+        k = make_klines(10)
+        broken = k[4].copy()
+        broken[HIGH] = -1
+        data, report = repair_klines(np.vstack([k[:5], broken]), '1m')
+        self.assertEqual(len(data), 5)
+        self.assertEqual(data[-1, HIGH], 101)
+        self.assertEqual(len(report.invalid), 1)
+        self.assertEqual(len(report.duplicates), 0)
+
+    def test_duplicates_keep_last(self):
+        k = make_klines(5)
+        newer = k[2].copy()
+        newer[CLOSE] = 555
+        data, report = repair_klines(np.vstack([k[:3], newer, k[3:]]), '1m')
+        self.assertEqual(len(data), 5)
+        self.assertEqual(data[2, CLOSE], 555)
+        self.assertEqual(report.duplicates.tolist(), [2 * MINUTE])
+
+    def test_unsorted_is_reordered(self):
+        k = make_klines(5)
+        data, report = repair_klines(k[[0, 2, 1, 3, 4]], '1m')
+        self.assertEqual(report.unsorted, 1)
+        self.assertEqual(data[:, 0].tolist(), k[:, 0].tolist())
+
+    def test_gap_sizes(self):
+        k = make_klines(10)
+        data, report = repair_klines(k[[0, 1, 4, 5, 9]], '1m')
+        self.assertEqual(report.gap_starts.tolist(), [2 * MINUTE, 6 * MINUTE])
+        self.assertEqual(report.gap_sizes.tolist(), [2, 3])
+        self.assertEqual(report.missing_bars, 5)
+        self.assertEqual(len(data), 5)
+
+    def test_ffill_builds_full_grid(self):
+        k = make_klines(6)
+        data, report = repair_klines(k[[0, 1, 4, 5]], '1m', mode='ffill')
+        self.assertEqual(data[:, 0].tolist(), k[:, 0].tolist())
+        self.assertEqual(report.filled.tolist(), [2 * MINUTE, 3 * MINUTE])
+        for row in data[2:4]:
+            # Nến điền là nến phẳng ở close của nến thật trước đó, volume 0
+            self.assertEqual(row[1:5].tolist(), [101.0] * 4)
+            self.assertEqual(row[5], 0)
+            self.assertEqual(row[CLOSE_TIME], row[0] + MINUTE - 1)
+        self.assertEqual(report.candles_out, 6)
+
+    def test_ffill_skips_offgrid_data(self):
+        k = make_klines(6)
+        k[5, 0] += 1
+        data, report = repair_klines(k[[0, 1, 4, 5]], '1m', mode='ffill')
+        self.assertEqual(len(data), 4)
+        self.assertEqual(len(report.filled), 0)
+        self.assertEqual(len(report.misaligned), 1)
+
+    def test_week_alignment_starts_on_monday(self):
+        week = INTERVAL_MS['1w']
+        # 1970-01-01 là thứ Năm, nến tuần đầu tiên của Binance mở ngày thứ Hai 1970-01-05
+        monday = 4 * DAY_MS + 2800 * week
+        data, report = repair_klines(make_klines(4, week, monday), '1w')
+        self.assertEqual(len(report.misaligned), 0)
+        _, report = repair_klines(make_klines(4, week, 2800 * week), '1w')
+        self.assertEqual(len(report.misaligned), 4)
+
+    def test_outlier_wick_flag_and_clip(self):
+        k = make_klines(20)
+        k[7, HIGH] = 500
+        _, report = repair_klines(k, '1m', wick_factor=20)
+        self.assertEqual(report.outlier_wicks.tolist(), [7 * MINUTE])
+        self.assertEqual(report.clipped_wicks, 0)
+
+        data, report = repair_klines(k, '1m', wick_factor=20, clip_wicks=True)
+        self.assertEqual(report.clipped_wicks, 1)
+        # Biên độ trung vị là 2, ngưỡng râu là 40 tính từ thân nến
+        self.assertEqual(data[7, HIGH], max(k[7, 1], k[7, CLOSE]) + 40)
+        self.assertEqual(k[7, HIGH], 500)
+
+    def test_invalid_mode(self):
+        with self.assertRaises(ValueError):
+            repair_klines(make_klines(3), '1m', mode='drop')
+
+
+class DataQualityPolicyTest(unittest.TestCase):
+    def test_off_and_variable_interval_skip(self):
+        k = make_klines(3)
+        self.assertIsNone(DataQualityPolicy('off').apply(k, '1m')[1])
+        self.assertIsNone(DataQualityPolicy().apply(k, '1M')[1])
+        self.assertIsNotNone(DataQualityPolicy().apply(k, '1m')[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import itertools
+import threading
+import time
+import unittest
+from unittest import mock
+
+from kline_downloader import KlineDownloader, WEIGHT_HEADER
+from timeutil import INTERVAL_MS
+
+
+class MockResponse:
+    def __init__(self, status_code, payload=None, headers=None):
+        self.status_code = status_code
+        self.payload = payload
+        self.headers = headers or {}
+
+    def json(self):
+        return self.payload
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+
+class MockSession:
+    """Session giả: request đầu tiên bị 429, các request sau trả về nến 1m đầu tiên trong khoảng"""
+
+    def __init__(self, retry_after, latency=0.05):
+        self.retry_after = retry_after
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.sent = []
+        self.blocked_at = None
+
+    def get(self, url, params=None, timeout=None):
+        with self.lock:
+            sent_at = time.time()
+            self.sent.append(sent_at)
+            if self.blocked_at is None:
+                self.blocked_at = sent_at
+                return MockResponse(429, headers={'Retry-After': str(self.retry_after)})
+        time.sleep(self.latency)
+        minute = INTERVAL_MS['1m']
+        open_time = -(-params['startTime'] // minute) * minute
+        rows = [] if open_time > params['endTime'] else [
+            [open_time, 1, 2, 0.5, 1.5, 10, open_time + minute - 1, 15, 3, 5, 7, 0]
+        ]
+        return MockResponse(200, rows, {WEIGHT_HEADER: '10'})
+
+
+class RetryAfterTest(unittest.TestCase):
+    def test_no_request_before_retry_after_deadline(self):
+        retry_after = 0.5
+        session = MockSession(retry_after)
+        downloader = KlineDownloader(base_url="http://mock", max_workers=4, limit=1, session=session)
+        pages = 8
+        # Mỗi lần acquire coi như đã sang cửa sổ 1 phút mới, giống khi Retry-After vắt qua mốc phút
+        windows = itertools.count()
+        with mock.patch.object(downloader.limiter, '_current_window', lambda: next(windows)):
+            klines = downloader.get_klines('BTCUSDT', '1m', 0, pages * INTERVAL_MS['1m'] - 1)
+
+        self.assertEqual(len(klines), pages)
+        deadline = session.blocked_at + retry_after
+        # Chỉ các request đã qua acquire() trước khi nhận 429 được phép gửi ngay sau đó
+        early = [t for t in session.sent if session.blocked_at + 0.02 < t < deadline]
+        self.assertEqual(early, [])
+        self.assertGreaterEqual(max(session.sent), deadline)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,151 @@
+import asyncio
+import threading
+import unittest
+
+from pivot_events import (AlertPipeline, MemorySink, PivotEmitter, PivotEvent, _SinkWorker,
+                          type_filter)
+
+
+class FakePivots:
+    """PivotData giả: mỗi nến có 'pivot' thì xác nhận một pivot loại đó"""
+
+    def __init__(self):
+        self.confirmed_pivots = []
+
+    def process_new_data(self, price_data):
+        if price_data.get('pivot'):
+            self.confirmed_pivots.append({'type': price_data['pivot'], 'price': price_data['price']})
+        return True
+
+
+def event(pivot_type='HH', price=1.0, key=('BTCUSDT', '30m')):
+    return PivotEvent(key, {'type': pivot_type, 'price': price})
+
+
+class PivotEmitterTest(unittest.TestCase):
+    def test_subscriber_error_does_not_stop_ingestion(self):
+        pivots = FakePivots()
+        emitter = PivotEmitter()
+        received = []
+
+        def broken(_):
+            raise RuntimeError("sink lỗi")
+
+        emitter.subscribe(broken)
+        emitter.subscribe(received.append)
+        emitter.attach(pivots, key='k')
+
+        self.assertTrue(pivots.process_new_data({'pivot': 'HH', 'price': 10.0}))
+        self.assertTrue(pivots.process_new_data({'price': 11.0}))
+        self.assertTrue(pivots.process_new_data({'pivot': 'LL', 'price': 9.0}))
+
+        self.assertEqual([e.pivot_type for e in received], ['HH', 'LL'])
+        self.assertEqual(received[0].key, 'k')
+        self.assertEqual(emitter.emitted, 2)
+        self.assertEqual(emitter.errors, 2)
+        self.assertIsInstance(emitter.last_error, RuntimeError)
+
+    def test_detach_restores_class_method(self):
+        pivots = FakePivots()
+        emitter = PivotEmitter()
+        emitter.attach(pivots)
+        emitter.detach(pivots)
+        self.assertNotIn('process_new_data', pivots.__dict__)
+
+
+class AlertPipelineTest(unittest.TestCase):
+    def run_pipeline(self, events, **kwargs):
+        sink = MemorySink()
+        pipeline = AlertPipeline([sink], **kwargs)
+
+        async def main():
+            await pipeline.start()
+            for item in events:
+                pipeline.publish(item)
+            await pipeline.stop()
+
+        asyncio.run(main())
+        return pipeline, sink
+
+    def test_filter(self):
+        pipeline, sink = self.run_pipeline([event('HH'), event('LL'), event('HH')],
+                                           filters=[type_filter('HH')])
+        self.assertEqual([e.pivot_type for e in sink.events], ['HH', 'HH'])
+        self.assertEqual(pipeline.stats()['filtered'], 1)
+        self.assertEqual(pipeline.stats()['published'], 3)
+
+    def test_debounce_keeps_last_event_per_key_and_type(self):
+        events = [event('HH', 1.0), event('HH', 2.0), event('HH', 3.0), event('LL', 4.0)]
+        pipeline, sink = self.run_pipeline(events, debounce_s=10)
+        self.assertEqual(sorted(e.pivot['price'] for e in sink.events), [3.0, 4.0])
+        self.assertEqual(pipeline.stats()['debounced'], 2)
+
+    def test_batching(self):
+        pipeline, sink = self.run_pipeline([event(price=i) for i in range(7)], batch_size=3, flush_interval=0.2)
+        self.assertEqual([e.pivot['price'] for e in sink.events], list(range(7)))
+        self.assertEqual(sink.batches, 3)
+
+    def test_lag_stats(self):
+        pipeline, _ = self.run_pipeline([event(price=i) for i in range(5)])
+        stats = pipeline.stats()['sinks'][0]
+        self.assertEqual(stats['sink'], 'MemorySink')
+        self.assertEqual(stats['delivered'], 5)
+        self.assertEqual((stats['dropped'], stats['errors']), (0, 0))
+        self.assertGreaterEqual(stats['lag_p50_ms'], 0)
+        self.assertLessEqual(stats['lag_p50_ms'], stats['lag_p95_ms'])
+        self.assertLessEqual(stats['lag_p95_ms'], stats['lag_max_ms'])
+
+    def test_publish_from_other_thread(self):
+        sink = MemorySink()
+        pipeline = AlertPipeline([sink])
+
+        async def main():
+            await pipeline.start()
+            worker = threading.Thread(target=lambda: [pipeline.publish(event(price=i)) for i in range(4)])
+            worker.start()
+            worker.join()
+            # Sự kiện từ thread khác đi qua call_soon_threadsafe, chờ loop nhận xong
+            await asyncio.sleep(0.05)
+            await pipeline.stop()
+
+        asyncio.run(main())
+        self.assertEqual(len(sink.events), 4)
+
+
+class SinkWorkerTest(unittest.TestCase):
+    def test_full_queue_drops_oldest(self):
+        sink = MemorySink()
+
+        async def main():
+            worker = _SinkWorker(sink, queue_size=2, batch_size=10, flush_interval=0.01, lag_window=100)
+            for i in range(5):
+                worker.offer(event(price=i))
+            worker.task = asyncio.create_task(worker.run())
+            await worker.queue.put(None)
+            await worker.task
+            return worker
+
+        worker = asyncio.run(main())
+        self.assertEqual(worker.dropped, 3)
+        self.assertEqual([e.pivot['price'] for e in sink.events], [3, 4])
+
+    def test_sink_error_is_counted(self):
+        class BrokenSink:
+            def write(self, events):
+                raise IOError("không ghi được")
+
+        sink = BrokenSink()
+        pipeline = AlertPipeline([sink])
+
+        async def main():
+            await pipeline.start()
+            pipeline.publish(event())
+            await pipeline.stop()
+
+        asyncio.run(main())
+        stats = pipeline.stats()['sinks'][0]
+        self.assertEqual((stats['delivered'], stats['errors']), (0, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
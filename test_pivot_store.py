@@ -0,0 +1,134 @@
+import pickle
+import statistics
+import unittest
+
+from pivot_store import PivotIndex, PivotStore, resolve_pivot_timestamp, vn_datetime_to_ms
+
+MINUTE = 60000
+
+
+def build_index(pivots):
+    index = PivotIndex()
+    for minute, price, pivot_type in pivots:
+        index.add(minute * MINUTE, price, pivot_type)
+    return index
+
+
+# Pivot theo phút: HH 0, HL 10, LH 20, HH 30, LL 60
+PIVOTS = [(0, 100, 'HH'), (10, 90, 'HL'), (20, 95, 'LH'), (30, 105, 'HH'), (60, 80, 'LL')]
+
+
+class PivotIndexQueryTest(unittest.TestCase):
+    def setUp(self):
+        self.index = build_index(PIVOTS)
+
+    def minutes(self, pivots):
+        return [pivot['timestamp'] // MINUTE for pivot in pivots]
+
+    def test_in_range_boundaries_are_inclusive(self):
+        self.assertEqual(self.minutes(self.index.in_range(10 * MINUTE, 30 * MINUTE)), [10, 20, 30])
+        self.assertEqual(self.minutes(self.index.in_range(10 * MINUTE + 1, 30 * MINUTE - 1)), [20])
+        self.assertEqual(self.minutes(self.index.in_range(end_ms=0)), [0])
+        self.assertEqual(self.minutes(self.index.in_range(start_ms=60 * MINUTE)), [60])
+        self.assertEqual(self.index.in_range(61 * MINUTE), [])
+        self.assertEqual(self.index.in_range(30 * MINUTE, 10 * MINUTE), [])
+        self.assertEqual(self.minutes(self.index.in_range(pivot_type='HH')), [0, 30])
+
+    def test_count_matches_in_range(self):
+        self.assertEqual(self.index.count(), 5)
+        self.assertEqual(self.index.count('HH', 0, 30 * MINUTE), 2)
+        self.assertEqual(self.index.count('HH', 1, 29 * MINUTE), 0)
+        self.assertEqual(self.index.count(start_ms=30 * MINUTE, end_ms=10 * MINUTE), 0)
+
+    def test_last_before(self):
+        self.assertEqual(self.index.last_before(20 * MINUTE)['timestamp'], 20 * MINUTE)
+        self.assertEqual(self.index.last_before(20 * MINUTE, inclusive=False)['timestamp'], 10 * MINUTE)
+        self.assertIsNone(self.index.last_before(0, inclusive=False))
+        self.assertIsNone(self.index.last_before(-1))
+        self.assertEqual(self.index.last_before(10 ** 12)['type'], 'LL')
+        self.assertEqual(self.index.last_before(59 * MINUTE, 'HH')['price'], 105)
+        self.assertIsNone(self.index.last_before(59 * MINUTE, 'LL'))
+
+    def test_first_after(self):
+        self.assertEqual(self.index.first_after(20 * MINUTE)['timestamp'], 20 * MINUTE)
+        self.assertEqual(self.index.first_after(20 * MINUTE, inclusive=False)['timestamp'], 30 * MINUTE)
+        self.assertIsNone(self.index.first_after(60 * MINUTE, inclusive=False))
+        self.assertEqual(self.index.first_after(-1)['timestamp'], 0)
+        self.assertEqual(self.index.first_after(1, 'HH')['timestamp'], 30 * MINUTE)
+        self.assertIsNone(self.index.first_after(31 * MINUTE, 'HH'))
+
+    def test_nearest(self):
+        self.assertEqual(self.index.nearest(44 * MINUTE)['timestamp'], 30 * MINUTE)
+        self.assertEqual(self.index.nearest(46 * MINUTE)['timestamp'], 60 * MINUTE)
+        # Cách đều hai phía thì chọn pivot phía trước
+        self.assertEqual(self.index.nearest(45 * MINUTE)['timestamp'], 30 * MINUTE)
+        self.assertEqual(self.index.nearest(-5 * MINUTE)['timestamp'], 0)
+        self.assertEqual(self.index.nearest(10 ** 12)['timestamp'], 60 * MINUTE)
+        self.assertEqual(self.index.nearest(50 * MINUTE, 'HL')['timestamp'], 10 * MINUTE)
+        self.assertIsNone(PivotIndex().nearest(0))
+
+
+class PivotIndexStatsTest(unittest.TestCase):
+    def test_gap_stats(self):
+        stats = build_index(PIVOTS).gap_stats()
+        gaps = [10, 10, 10, 30]
+        self.assertEqual(stats['gaps'], 4)
+        self.assertAlmostEqual(stats['avg_gap_minutes'], statistics.mean(gaps))
+        self.assertEqual((stats['min_gap_minutes'], stats['max_gap_minutes']), (10, 30))
+        self.assertAlmostEqual(stats['std_gap_minutes'], statistics.pstdev(gaps))
+
+    def test_gap_stats_small_index(self):
+        self.assertIsNone(PivotIndex().gap_stats()['avg_gap_minutes'])
+        stats = build_index(PIVOTS[:2]).gap_stats()
+        self.assertEqual(stats['avg_gap_minutes'], 10)
+        self.assertIsNone(stats['std_gap_minutes'])
+
+    def test_out_of_order_insert(self):
+        # Pivot khởi tạo đến sau pivot mới nhất: chèn đúng chỗ, khoảng cách được tính lại
+        index = build_index([PIVOTS[0], PIVOTS[1], PIVOTS[3], PIVOTS[4]])
+        index.add(20 * MINUTE, 95, 'LH')
+        index.add(5 * MINUTE, 98, 'HH')
+        self.assertTrue(index._gaps_dirty)
+        self.assertEqual([t // MINUTE for t in index.timestamps], [0, 5, 10, 20, 30, 60])
+        self.assertEqual([t // MINUTE for t in index.by_type['HH'][0]], [0, 5, 30])
+        self.assertEqual(index.by_type['HH'][1], [100, 98, 105])
+        self.assertEqual(index.counts['HH'], 3)
+
+        stats = index.gap_stats()
+        gaps = [5, 5, 10, 10, 30]
+        self.assertFalse(index._gaps_dirty)
+        self.assertEqual(stats['gaps'], 5)
+        self.assertEqual(stats['min_gap_minutes'], 5)
+        self.assertAlmostEqual(stats['std_gap_minutes'], statistics.pstdev(gaps))
+
+        # Thêm theo thứ tự sau khi tính lại vẫn cộng dồn đúng
+        index.add(70 * MINUTE, 85, 'HL')
+        self.assertAlmostEqual(index.gap_stats()['std_gap_minutes'], statistics.pstdev(gaps + [10]))
+
+    def test_clear(self):
+        index = build_index(PIVOTS)
+        index.clear()
+        self.assertEqual(len(index), 0)
+        self.assertEqual(index.counts['HH'], 0)
+        self.assertEqual(index.gap_stats()['gaps'], 0)
+
+
+class PivotStoreTest(unittest.TestCase):
+    def test_pickle_rebuilds_index(self):
+        store = PivotStore(capacity=1)
+        for minute, price, pivot_type in PIVOTS:
+            store.append(minute * MINUTE, price, pivot_type)
+        restored = pickle.loads(pickle.dumps(store))
+        self.assertEqual(len(restored), 5)
+        self.assertEqual(restored.index.timestamps, store.index.timestamps)
+        self.assertEqual(restored.index.counts, store.index.counts)
+
+    def test_resolve_pivot_timestamp_across_midnight(self):
+        # Nến xác nhận lúc 00:30 VN ngày 16/03, pivot 23:45 thuộc ngày 15/03
+        candle_ms = vn_datetime_to_ms('2025-03-16 00:30')
+        self.assertEqual(resolve_pivot_timestamp('23:45', candle_ms), vn_datetime_to_ms('2025-03-15 23:45'))
+        self.assertEqual(resolve_pivot_timestamp('00:30', candle_ms), candle_ms)
+
+
+if __name__ == "__main__":
+    unittest.main()
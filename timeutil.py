@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta, timezone
+
+# Việt Nam không có giờ mùa hè nên dùng offset cố định +7
+VN_OFFSET_MS = 7 * 60 * 60 * 1000
+DAY_MS = 24 * 60 * 60 * 1000
+MINUTE_MS = 60 * 1000
+VN_TZ = timezone(timedelta(hours=7), 'Asia/Ho_Chi_Minh')
+
+# Độ dài mỗi interval của Binance
+INTERVAL_MS = {
+    '1m': MINUTE_MS, '3m': 3 * MINUTE_MS, '5m': 5 * MINUTE_MS, '15m': 15 * MINUTE_MS,
+    '30m': 30 * MINUTE_MS, '1h': 60 * MINUTE_MS, '2h': 120 * MINUTE_MS, '4h': 240 * MINUTE_MS,
+    '6h': 360 * MINUTE_MS, '8h': 480 * MINUTE_MS, '12h': 720 * MINUTE_MS,
+    '1d': 1440 * MINUTE_MS, '3d': 3 * 1440 * MINUTE_MS, '1w': 7 * 1440 * MINUTE_MS,
+}
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def vn_zoneinfo():
+    """Múi giờ Asia/Ho_Chi_Minh của zoneinfo (stdlib), dùng VN_TZ nếu máy thiếu dữ liệu tzdata"""
+    try:
+        from zoneinfo import ZoneInfo
+        return ZoneInfo('Asia/Ho_Chi_Minh')
+    except Exception:
+        return VN_TZ
+
+# Nhãn 'HH:MM' cho mọi phút trong ngày, tra bảng thay cho strftime
+MINUTE_LABELS = [f"{minute // 60:02d}:{minute % 60:02d}" for minute in range(24 * 60)]
+_DAY_LABELS = {}
+
+
+def day_label(day):
+    """Số ngày kể từ 1970-01-01 -> 'YYYY-MM-DD', có cache vì số ngày khác nhau rất ít"""
+    label = _DAY_LABELS.get(day)
+    if label is None:
+        label = (_EPOCH + timedelta(days=day)).strftime('%Y-%m-%d')
+        _DAY_LABELS[day] = label
+    return label
+
+
+def split_ms(timestamp_ms, offset_ms=0):
+    """Epoch ms -> (số ngày, phút trong ngày) theo múi giờ có offset_ms"""
+    local_ms = timestamp_ms + offset_ms
+    return local_ms // DAY_MS, (local_ms % DAY_MS) // MINUTE_MS
+
+
+def vn_labels(timestamp_ms):
+    """Epoch ms UTC -> ('YYYY-MM-DD', 'HH:MM') giờ VN"""
+    day, minute = split_ms(int(timestamp_ms), VN_OFFSET_MS)
+    return day_label(day), MINUTE_LABELS[minute]
+
+
+def make_price_data(vn_day, vn_minute, price, high, low):
+    """price_data cho pivot_data.process_new_data từ ngày/phút giờ VN dạng số (split_ms, add_time_columns)"""
+    vn_time = MINUTE_LABELS[vn_minute]
+    return {
+        'time': vn_time,                # Thời gian Việt Nam
+        'vn_time': vn_time,             # Đánh dấu rõ là thời gian Việt Nam
+        'price': price,
+        'high': high,
+        'low': low,
+        'vn_date': day_label(vn_day)    # Đánh dấu rõ là ngày Việt Nam
+    }
+
+
+def utc_labels(timestamp_ms):
+    """Epoch ms UTC -> ('YYYY-MM-DD', 'HH:MM') giờ UTC"""
+    day, minute = split_ms(int(timestamp_ms))
+    return day_label(day), MINUTE_LABELS[minute]
+
+
+def add_time_columns(df):
+    """
+    Thêm cột thời gian dạng số từ cột timestamp (epoch ms UTC, int64), không tạo chuỗi
+
+    vn_day: số ngày (giờ VN) kể từ 1970-01-01
+    vn_minute: phút trong ngày (giờ VN)
+    """
+    local_ms = df['timestamp'] + VN_OFFSET_MS
+    df['vn_day'] = (local_ms // DAY_MS).astype('int32')
+    df['vn_minute'] = ((local_ms % DAY_MS) // MINUTE_MS).astype('int16')
+    return df
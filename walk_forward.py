@@ -0,0 +1,208 @@
+import csv
+import os
+import sys
+import traceback
+from datetime import datetime, timedelta
+
+from kline_cache import DEFAULT_CACHE_DIR, to_ms
+from pivot_store import PivotIndex, PIVOT_TYPES, ms_to_vn_datetime, vn_datetime_to_ms, seed_initial_pivots
+from timeutil import INTERVAL_MS
+
+WALK_FORWARD_FILE = "walk_forward.csv"
+WALK_FORWARD_LOG_FILE = "debug_walk_forward.log"
+METRIC_COLUMNS = [
+    'segment', 'start_time', 'end_time', 'candles', 'missing_bars', 'seed_pivots', 'pivots',
+    *PIVOT_TYPES,
+    'avg_gap_minutes', 'min_gap_minutes', 'max_gap_minutes', 'std_gap_minutes',
+    'reference_pivots', 'matched_reference', 'matched_s1', 'precision', 'recall',
+]
+
+
+def segment_ranges(start_time, end_time, segment_days):
+    """Chia [start_time, end_time) thành các đoạn liên tiếp dài segment_days ngày"""
+    step = timedelta(days=segment_days)
+    segment_start = start_time
+    while segment_start < end_time:
+        segment_end = min(segment_start + step, end_time)
+        yield segment_start, segment_end
+        segment_start = segment_end
+
+
+def seed_from_index(index, count):
+    """count pivot cuối trong index, dạng pivot khởi tạo giờ VN như DEFAULT_INITIAL_PIVOTS"""
+    seeds = []
+    for timestamp, price, pivot_type in zip(index.timestamps[-count:], index.prices[-count:], index.types[-count:]):
+        vn_date, vn_time = ms_to_vn_datetime(timestamp).split(' ')
+        seeds.append({
+            'type': pivot_type,
+            'price': price,
+            'vn_time': vn_time,
+            'vn_date': vn_date,
+            'direction': 'high' if pivot_type in ('HH', 'LH') else 'low',
+            'confirmed': True
+        })
+    return seeds
+
+
+def load_reference_pivots(path):
+    """
+    Đọc file pivot tham chiếu (CSV) vào PivotIndex
+
+    Cần cột type, price và một trong: timestamp (epoch ms UTC), datetime (giờ VN, ví dụ
+    file pivots export từ test_s1) hoặc vn_date + vn_time.
+    """
+    index = PivotIndex()
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            if row.get('timestamp'):
+                timestamp = int(float(row['timestamp']))
+            elif row.get('datetime'):
+                timestamp = vn_datetime_to_ms(row['datetime'][:16])
+            else:
+                timestamp = vn_datetime_to_ms(f"{row['vn_date']} {row['vn_time']}")
+            index.add(timestamp, float(row['price']), row['type'])
+    return index
+
+
+def count_matches(source, target, start_ms, end_ms, tolerance_ms):
+    """Số pivot của source trong khoảng có pivot cùng loại trong target cách không quá tolerance_ms"""
+    matched = 0
+    for pivot in source.in_range(start_ms, end_ms):
+        nearest = target.nearest(pivot['timestamp'], pivot['type'])
+        if nearest is not None and abs(nearest['timestamp'] - pivot['timestamp']) <= tolerance_ms:
+            matched += 1
+    return matched
+
+
+def run_walk_forward(symbol, interval, start_time, end_time, segment_days=7, seed_count=4,
+                     initial_pivots=None, reference_file=None, metrics_file=WALK_FORWARD_FILE,
+                     tolerance_ms=None, offline=True, cache_dir=None, user_login="lenhat20791"):
+    """
+    Trượt qua lịch sử dài theo từng đoạn, mỗi đoạn chạy S1 với PivotData được seed bằng
+    seed_count pivot cuối của đoạn trước (đoạn đầu dùng initial_pivots nếu có)
+
+    Mỗi đoạn chỉ nạp nến của đoạn đó và ghi ngay một dòng thống kê ra metrics_file,
+    nên bộ nhớ không tăng theo độ dài lịch sử.
+
+    Parameters:
+    start_time, end_time (datetime): Khoảng thời gian UTC
+    reference_file (str): CSV pivot tham chiếu để tính precision/recall, xem load_reference_pivots
+    tolerance_ms (int): Độ lệch thời gian tối đa để hai pivot cùng loại được coi là khớp,
+        mặc định một nến
+
+    Returns:
+    int: Số đoạn đã chạy
+    """
+    from s1 import PivotData
+    from test_s1 import S1HistoricalTester
+
+    tester = S1HistoricalTester(
+        user_login,
+        offline=offline,
+        cache_dir=cache_dir or DEFAULT_CACHE_DIR,
+        symbol=symbol,
+        interval=interval,
+        pivots=PivotData(),
+        log_file=WALK_FORWARD_LOG_FILE
+    )
+    reference = load_reference_pivots(reference_file) if reference_file else None
+    tolerance_ms = INTERVAL_MS[interval] if tolerance_ms is None else tolerance_ms
+    seeds = initial_pivots or []
+    segments = 0
+
+    with open(metrics_file, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=METRIC_COLUMNS)
+        writer.writeheader()
+
+        for segment_start, segment_end in segment_ranges(start_time, end_time, segment_days):
+            tester.log_message(f"\n=== Đoạn {segments + 1}: {segment_start} - {segment_end} (UTC) ===", "SUMMARY")
+            # Nến có open time trong [segment_start, segment_end)
+            df = tester.load_candles(segment_start, segment_end - timedelta(milliseconds=1))
+            row = {'segment': segments + 1, 'start_time': segment_start, 'end_time': segment_end,
+                   'candles': 0 if df is None else len(df), 'seed_pivots': len(seeds)}
+            if tester.last_quality is not None:
+                row['missing_bars'] = tester.last_quality.missing_bars
+
+            pivots = tester.pivot_data
+            store = tester.pivot_store
+            pivots.clear_all()
+            store.clear()
+            if seeds:
+                seed_initial_pivots(pivots, seeds, tester.log_message)
+                for pivot in seeds:
+                    store.add_pivot(pivot)
+            if df is not None:
+                tester.feed_candles(df)
+
+            # Chỉ tính pivot nằm trong đoạn, không tính pivot seed
+            start_ms = to_ms(segment_start)
+            end_ms = to_ms(segment_end) - 1
+            segment_index = PivotIndex()
+            for pivot in store.index.in_range(start_ms, end_ms):
+                segment_index.add(pivot['timestamp'], pivot['price'], pivot['type'])
+
+            row['pivots'] = len(segment_index)
+            row.update(segment_index.counts)
+            gaps = segment_index.gap_stats()
+            for key in ('avg_gap_minutes', 'min_gap_minutes', 'max_gap_minutes', 'std_gap_minutes'):
+                row[key] = gaps[key]
+
+            if reference is not None:
+                matched_s1 = count_matches(segment_index, reference, start_ms, end_ms, tolerance_ms)
+                matched_reference = count_matches(reference, segment_index, start_ms, end_ms, tolerance_ms)
+                reference_count = reference.count(start_ms=start_ms, end_ms=end_ms)
+                row['reference_pivots'] = reference_count
+                row['matched_reference'] = matched_reference
+                row['matched_s1'] = matched_s1
+                row['precision'] = matched_s1 / len(segment_index) if len(segment_index) else None
+                row['recall'] = matched_reference / reference_count if reference_count else None
+
+            writer.writerow(row)
+            f.flush()
+            segments += 1
+
+            # Đoạn sau tiếp tục từ các pivot cuối của đoạn này (kể cả seed nếu đoạn không có pivot mới)
+            if len(store.index):
+                seeds = seed_from_index(store.index, seed_count)
+            del df
+
+    tester.log_message(f"\n✅ Walk-forward xong {segments} đoạn, thống kê tại {metrics_file}", "SUCCESS")
+    tester.log_sink.flush()
+    return segments
+
+
+def main():
+    """
+    Ví dụ: S1_OFFLINE=1 python walk_forward.py BTCUSDT 30m "2023-01-01 00:00:00" "2025-01-01 00:00:00" [số ngày mỗi đoạn]
+
+    Thời gian theo UTC. S1_REFERENCE_PIVOTS: file CSV pivot tham chiếu để tính precision/recall.
+    """
+    if len(sys.argv) < 5:
+        print(main.__doc__)
+        return None
+
+    try:
+        symbol, interval = sys.argv[1], sys.argv[2]
+        start_time = datetime.strptime(sys.argv[3], '%Y-%m-%d %H:%M:%S')
+        end_time = datetime.strptime(sys.argv[4], '%Y-%m-%d %H:%M:%S')
+        segment_days = int(sys.argv[5]) if len(sys.argv) > 5 else 7
+
+        segments = run_walk_forward(
+            symbol, interval, start_time, end_time,
+            segment_days=segment_days,
+            reference_file=os.environ.get('S1_REFERENCE_PIVOTS'),
+            offline=os.environ.get('S1_OFFLINE', '1') == '1',
+            cache_dir=os.environ.get('KLINE_CACHE_DIR'),
+            user_login=os.environ.get('CURRENT_USER', 'lenhat20791')
+        )
+        print(f"Walk-forward hoàn tất: {segments} đoạn, xem {WALK_FORWARD_FILE}")
+        return segments
+
+    except Exception as e:
+        print(f"Lỗi: {str(e)}")
+        print(traceback.format_exc())
+        return None
+
+
+if __name__ == "__main__":
+    main()